@@ -0,0 +1,187 @@
+'''
+    Throughput benchmark of the hot paths of the KG construction. Each stage is run over the same tables and reports its
+    time, tables/sec, triples/sec (where triples are produced) and peak RSS. The input is either given or a synthetic
+    corpus is generated (see synth_data.py). With a baseline report, the stages that became slower are reported.
+'''
+
+import argparse
+import json
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import data_utils as du
+import synth_data
+from data_prep.table import Table
+from tbl_kg_mapper import Tbl2KgMapper
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Use this script to benchmark the WikiTablesKG construction.')
+    parser.add_argument('-i', '--tables', help='The table input file, if not given a synthetic corpus is generated.', required=False)
+    parser.add_argument('-t', '--taxonomy', help='The path to the flat category taxonomy.', required=False)
+    parser.add_argument('-ec', '--entity_cat', help='The path to the entity category associations.', required=False)
+    parser.add_argument('-dl', '--data_limit', help='The maximum number of tables we benchmark on.', type=int, default=None)
+    parser.add_argument('-nt', '--num_tables', help='The number of tables of the synthetic corpus.', type=int, default=5000)
+    parser.add_argument('-r', '--rows', help='The maximum number of rows of the synthetic tables.', type=int, default=20)
+    parser.add_argument('-c', '--columns', help='The maximum number of columns of the synthetic tables.', type=int, default=6)
+    parser.add_argument('-sr', '--struct_ratio', help='The ratio of STRUCT cells of the synthetic tables.', type=float, default=0.5)
+    parser.add_argument('-d', '--depth', help='The depth of the synthetic taxonomy.', type=int, default=8)
+    parser.add_argument('-o', '--out_file', help='Write the results as a JSON report.', required=False)
+    parser.add_argument('-b', '--baseline', help='A previous JSON report, the stages that are slower than in the baseline are reported.', required=False)
+    parser.add_argument('-tol', '--tolerance', help='The relative slowdown (of tables/sec) that we tolerate w.r.t. the baseline.', type=float, default=0.1)
+    return parser.parse_args()
+
+
+'''
+    The peak RSS (in MB) since the last reset. On Linux the peak is reset for every stage (via /proc/self/clear_refs),
+    otherwise it is the peak of the whole process.
+'''
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as fout:
+            fout.write('5')
+    except OSError:
+        pass
+
+
+def get_peak_rss():
+    try:
+        with open('/proc/self/status', 'rt') as fin:
+            for line in fin:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+'''
+    Run a stage, which returns the number of processed tables and produced triples.
+'''
+
+
+def run_stage(results, name, fn):
+    reset_peak_rss()
+    start = time.perf_counter()
+    num_tables, num_triples = fn()
+    elapsed = time.perf_counter() - start
+
+    stats = {'seconds': elapsed, 'tables': num_tables, 'tables_per_sec': num_tables / elapsed if elapsed else 0.0, 'peak_rss_mb': get_peak_rss()}
+    if num_triples is not None:
+        stats['triples'] = num_triples
+        stats['triples_per_sec'] = num_triples / elapsed if elapsed else 0.0
+    results[name] = stats
+
+    triples_str = '' if num_triples is None else ', {:.0f} triples/sec'.format(stats['triples_per_sec'])
+    print('{:<24}{:8.2f}s, {:.0f} tables/sec{}, peak RSS {:.1f} MB'.format(name, elapsed, stats['tables_per_sec'], triples_str, stats['peak_rss_mb']))
+
+
+def run_benchmark(tables_file, taxonomy_path, ecats_path, limit=None):
+    results = {}
+    resources = {}
+
+    def load_resources():
+        resources['tax'] = du.load_flat_cat_tax(taxonomy_path)
+        resources['ecats'] = du.load_entity_cats(ecats_path)
+        du.get_tax_index(resources['tax'])
+        return 0, None
+
+    run_stage(results, 'load_resources', load_resources)
+    tax, ecats = resources['tax'], resources['ecats']
+    tax_index = du.get_tax_index(tax)
+
+    tables_json = []
+
+    def json_decode():
+        tables_json.extend(du.iter_table_json(tables_file, limit=limit))
+        return len(tables_json), None
+
+    tables = []
+
+    def load_json():
+        for table, entity_label, section_label in tables_json:
+            tbl_obj = Table(flat_taxonomy=tax, ecats=ecats)
+            tbl_obj.load_json(table, entity_label, section_label)
+            tables.append(tbl_obj)
+        return len(tables), None
+
+    def find_lca_category():
+        # without the memoized entity ancestors of the previous stages
+        tax_index.entity_ancestors.clear()
+        for tbl_obj in tables:
+            for col_idx in range(tbl_obj.num_cols):
+                seeds = [entity for row in tbl_obj.table_rows if row[col_idx] is not None and row[col_idx][0] == 'STRUCT' for entity in row[col_idx][1]]
+                if seeds:
+                    du.find_lca_category(tax, seeds, ecats)
+        return len(tables), None
+
+    def map_table_to_resource():
+        mapper = Tbl2KgMapper(tables=tables, out_dir=None)
+        num_triples = 0
+        for tbl_obj in tables:
+            num_triples += mapper.map_table_to_resource(tbl_obj).count('\n')
+        return len(tables), num_triples
+
+    def load_tables():
+        tax_index.entity_ancestors.clear()
+        return len(du.load_tables(tables_file, limit=limit, tax=tax, ecats=ecats)), None
+
+    run_stage(results, 'json_decode', json_decode)
+    run_stage(results, 'load_json', load_json)
+    run_stage(results, 'find_lca_category', find_lca_category)
+    run_stage(results, 'map_table_to_resource', map_table_to_resource)
+    tables_json.clear()
+    tables.clear()
+    run_stage(results, 'load_tables', load_tables)
+    return results
+
+
+'''
+    The stages whose tables/sec dropped by more than the tolerance compared to the baseline report.
+'''
+
+
+def compare_to_baseline(results, baseline_file, tolerance):
+    with open(baseline_file, 'rt') as fin:
+        baseline = json.load(fin)['stages']
+
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline or not baseline[name]['tables_per_sec']:
+            continue
+        change = stats['tables_per_sec'] / baseline[name]['tables_per_sec'] - 1
+        if change < -tolerance:
+            regressions.append(name)
+            print('Regression in {}: {:.0f} tables/sec vs. {:.0f} in the baseline ({:+.1%}).'.format(name, stats['tables_per_sec'], baseline[name]['tables_per_sec'], change))
+    return regressions
+
+
+if __name__ == '__main__':
+    arg = get_arguments()
+
+    tmp_dir = None
+    if arg.tables is None:
+        tmp_dir = tempfile.mkdtemp(prefix='wikitblkg_bench_')
+        tables_file, taxonomy_path, ecats_path = synth_data.generate_corpus(tmp_dir, num_tables=arg.num_tables, rows=arg.rows, columns=arg.columns,
+                                                                           struct_ratio=arg.struct_ratio, depth=arg.depth)
+    else:
+        tables_file, taxonomy_path, ecats_path = arg.tables, arg.taxonomy, arg.entity_cat
+
+    try:
+        results = run_benchmark(tables_file, taxonomy_path, ecats_path, limit=arg.data_limit)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    if arg.out_file is not None:
+        with open(arg.out_file, 'wt') as fout:
+            json.dump({'input': arg.tables, 'args': vars(arg), 'stages': results}, fout, indent=2)
+
+    if arg.baseline is not None and compare_to_baseline(results, arg.baseline, arg.tolerance):
+        sys.exit(1)
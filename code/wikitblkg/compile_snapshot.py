@@ -0,0 +1,49 @@
+import argparse
+import os
+
+from data_prep import cat_store, input_index, shared_store, snapshot
+from data_prep.tax_index import TaxIndex
+
+'''
+    Compile the taxonomy and entity category TSV files into binary snapshots, which are written next to the TSV files
+    and are picked up automatically by data_utils.load_flat_cat_tax and data_utils.load_entity_cats. Additionally, the
+    tables input file can be indexed, such that data_utils.iter_table_json can seek directly to the start offset.
+    With -r, the taxonomy, its ancestor closure and the entity categories are compiled into a single snapshot of shared
+    KG resources (see data_prep.shared_store), which is passed to extract_graph.py and table_stats.py with -sr.
+'''
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Use this script to compile the taxonomy and entity categories into binary snapshots for fast loading.')
+    parser.add_argument('-t', '--taxonomy', help='The path to the flat category taxonomy.', required=False)
+    parser.add_argument('-ec', '--entity_cat', help='The path to the entity category associations.', required=False)
+    parser.add_argument('-r', '--resources', help='The output path of the shared KG resources, e.g. under /dev/shm (requires -t and -ec).', required=False)
+    parser.add_argument('-i', '--tables', help='The table input file for which we build the byte-offset index.', required=False)
+    arg = parser.parse_args()
+    if arg.resources is not None and (arg.taxonomy is None or arg.entity_cat is None):
+        parser.error('The shared resources require the taxonomy and the entity categories.')
+    return arg
+
+
+if __name__ == '__main__':
+    arg = get_arguments()
+
+    if arg.taxonomy is not None:
+        tax = cat_store.build_taxonomy(arg.taxonomy)
+        cat_store.write_taxonomy_snapshot(tax, snapshot.get_snapshot_path(arg.taxonomy))
+        print('Compiled the taxonomy data with {:d} instances into {}.'.format(len(tax), snapshot.get_snapshot_path(arg.taxonomy)))
+
+    if arg.entity_cat is not None:
+        ecats = cat_store.build_entity_cats(arg.entity_cat)
+        cat_store.write_entity_cats_snapshot(ecats, snapshot.get_snapshot_path(arg.entity_cat))
+        print('Compiled the entity category data with {:d} instances into {}.'.format(len(ecats), snapshot.get_snapshot_path(arg.entity_cat)))
+
+    if arg.resources is not None:
+        tax_index = TaxIndex(tax)
+        sources = {'taxonomy': os.path.abspath(arg.taxonomy), 'entity_cat': os.path.abspath(arg.entity_cat)}
+        shared_store.write_resources(arg.resources, tax, ecats, tax_index, sources=sources)
+        print('Compiled the shared resources with {:d} closure entries into {}.'.format(len(tax_index.anc_values), arg.resources))
+
+    if arg.tables is not None:
+        num_tables = input_index.build_input_index(arg.tables)
+        print('Indexed {:d} tables into {}.'.format(num_tables, input_index.get_index_path(arg.tables)))
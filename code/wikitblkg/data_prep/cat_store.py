@@ -0,0 +1,280 @@
+'''
+    Integer-encoded representations of the flat category taxonomy and the entity category associations. They provide
+    the same lookup interface as the dictionaries of data_utils.load_flat_cat_tax and data_utils.load_entity_cats,
+    however, the data is kept in flat arrays, which can be written into and memory-mapped from a snapshot.
+'''
+
+import gzip
+from array import array
+
+from data_prep import snapshot
+from data_prep.cat_tax import CatTax
+
+'''
+    A table of interned strings. The i-th string is stored as UTF-8 in blob[offsets[i]:offsets[i + 1]], and order
+    contains the string IDs sorted by their UTF-8 bytes, which we use to look up the ID of a string.
+'''
+
+
+class StringTable:
+    def __init__(self, blob, offsets, order):
+        self.blob = blob
+        self.offsets = offsets
+        self.order = order
+
+    @staticmethod
+    def build(strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = array('q', [0])
+        total = 0
+        for s in encoded:
+            total += len(s)
+            offsets.append(total)
+        order = array('i', sorted(range(len(encoded)), key=encoded.__getitem__))
+        return StringTable(b''.join(encoded), offsets, order)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        return str(self.blob[self.offsets[idx]:self.offsets[idx + 1]], 'utf-8')
+
+    def find(self, s):
+        key = s.encode('utf-8')
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            idx = self.order[mid]
+            val = bytes(self.blob[self.offsets[idx]:self.offsets[idx + 1]])
+            if val < key:
+                lo = mid + 1
+            elif val > key:
+                hi = mid
+            else:
+                return idx
+        return -1
+
+    def to_sections(self, prefix):
+        return {prefix + '_blob': self.blob, prefix + '_offsets': self.offsets, prefix + '_order': self.order}
+
+    @staticmethod
+    def from_sections(sections, prefix):
+        return StringTable(sections[prefix + '_blob'], sections[prefix + '_offsets'], sections[prefix + '_order'])
+
+
+'''
+    The flat category taxonomy. The names with IDs lower than num_cats are the categories of the taxonomy (in the order
+    of the taxonomy file), whereas the remaining names only appear as parents. The parents of the category i, together
+    with the level they were listed with, are stored in parent_ids/parent_levels[parent_offsets[i]:parent_offsets[i + 1]].
+'''
+
+
+class CategoryTaxonomy:
+    def __init__(self, names, num_cats, levels, parent_offsets, parent_ids, parent_levels):
+        self.names = names
+        self.num_cats = num_cats
+        self.levels = levels
+        self.parent_offsets = parent_offsets
+        self.parent_ids = parent_ids
+        self.parent_levels = parent_levels
+
+    def __len__(self):
+        return self.num_cats
+
+    def __iter__(self):
+        for idx in range(self.num_cats):
+            yield self.names[idx]
+
+    def keys(self):
+        return iter(self)
+
+    def __contains__(self, cat_name):
+        return self.get_id(cat_name) != -1
+
+    def __getitem__(self, cat_name):
+        idx = self.get_id(cat_name)
+        if idx == -1:
+            raise KeyError(cat_name)
+        return self.get_cat(idx)
+
+    def get(self, cat_name, default=None):
+        idx = self.get_id(cat_name)
+        return default if idx == -1 else self.get_cat(idx)
+
+    def get_id(self, cat_name):
+        idx = self.names.find(cat_name)
+        return idx if idx < self.num_cats else -1
+
+    def get_cat(self, idx):
+        cat = CatTax(self.names[idx], self.levels[idx])
+        for pos in range(self.parent_offsets[idx], self.parent_offsets[idx + 1]):
+            cat.add_parent(CatTax(self.names[self.parent_ids[pos]], self.parent_levels[pos]))
+        return cat
+
+    def to_sections(self):
+        sections = self.names.to_sections('names')
+        sections.update({'levels': self.levels, 'parent_offsets': self.parent_offsets, 'parent_ids': self.parent_ids, 'parent_levels': self.parent_levels})
+        return sections
+
+    @staticmethod
+    def from_sections(header, sections):
+        return CategoryTaxonomy(StringTable.from_sections(sections, 'names'), header['meta']['num_cats'], sections['levels'],
+                                sections['parent_offsets'], sections['parent_ids'], sections['parent_levels'])
+
+
+'''
+    The entity category associations. The categories of the entity i are categories[cat_ids[cat_offsets[i]:cat_offsets[i + 1]]].
+'''
+
+
+class EntityCategories:
+    def __init__(self, entities, categories, cat_offsets, cat_ids):
+        self.entities = entities
+        self.categories = categories
+        self.cat_offsets = cat_offsets
+        self.cat_ids = cat_ids
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __iter__(self):
+        for idx in range(len(self.entities)):
+            yield self.entities[idx]
+
+    def keys(self):
+        return iter(self)
+
+    def __contains__(self, entity):
+        return self.entities.find(entity) != -1
+
+    def __getitem__(self, entity):
+        idx = self.entities.find(entity)
+        if idx == -1:
+            raise KeyError(entity)
+        return self.get_categories(idx)
+
+    def get(self, entity, default=None):
+        idx = self.entities.find(entity)
+        return default if idx == -1 else self.get_categories(idx)
+
+    def get_categories(self, idx):
+        return [self.categories[self.cat_ids[pos]] for pos in range(self.cat_offsets[idx], self.cat_offsets[idx + 1])]
+
+    def to_sections(self):
+        sections = self.entities.to_sections('entities')
+        sections.update(self.categories.to_sections('categories'))
+        sections.update({'cat_offsets': self.cat_offsets, 'cat_ids': self.cat_ids})
+        return sections
+
+    @staticmethod
+    def from_sections(header, sections):
+        return EntityCategories(StringTable.from_sections(sections, 'entities'), StringTable.from_sections(sections, 'categories'),
+                                sections['cat_offsets'], sections['cat_ids'])
+
+
+'''
+    Build the integer-encoded taxonomy from the taxonomy TSV file, parsed in the same way as in load_flat_cat_tax.
+'''
+
+
+def build_taxonomy(tax_path):
+    name_ids = {}
+    names = []
+    levels = []
+    parents = []
+
+    def intern(name):
+        idx = name_ids.get(name)
+        if idx is None:
+            idx = name_ids[name] = len(names)
+            names.append(name)
+        return idx
+
+    # the categories of the taxonomy come first, such that they keep the order of the taxonomy file.
+    edges = []
+    for line in gzip.open(tax_path, 'rt', encoding='latin_1'):
+        data = line.strip().lower().split('\t')
+        child = data[2]
+        if child not in name_ids:
+            intern(child)
+            levels.append(int(data[3]))
+            parents.append([])
+        edges.append((name_ids[child], data[0], int(data[1])))
+
+    num_cats = len(names)
+    for child_id, parent_name, parent_level in edges:
+        parents[child_id].append((intern(parent_name), parent_level))
+
+    parent_offsets = array('q', [0])
+    parent_ids = array('i')
+    parent_levels = array('i')
+    for cat_parents in parents:
+        for parent_id, parent_level in cat_parents:
+            parent_ids.append(parent_id)
+            parent_levels.append(parent_level)
+        parent_offsets.append(len(parent_ids))
+
+    return CategoryTaxonomy(StringTable.build(names), num_cats, array('i', levels), parent_offsets, parent_ids, parent_levels)
+
+
+'''
+    Build the integer-encoded entity categories from the TSV file, parsed in the same way as in load_entity_cats. If a
+    set of entities is given, only the categories of these entities are kept.
+'''
+
+
+def build_entity_cats(ec_path, entities=None):
+    def iter_entity_cats():
+        for line in gzip.open(ec_path, 'rt', encoding='latin_1'):
+            data = line.strip().lower().split('\t')
+            if len(data) != 2:
+                continue
+            if entities is not None and data[0] not in entities:
+                continue
+            yield data[0], data[1]
+
+    return encode_entity_cats(iter_entity_cats())
+
+
+'''
+    Encode the (entity, category) pairs, where the pairs of an entity need not be consecutive.
+'''
+
+
+def encode_entity_cats(pairs):
+    entity_cats = {}
+    cat_ids = {}
+    for entity, category in pairs:
+        cat_id = cat_ids.get(category)
+        if cat_id is None:
+            cat_id = cat_ids[category] = len(cat_ids)
+
+        if entity not in entity_cats:
+            entity_cats[entity] = array('i')
+        entity_cats[entity].append(cat_id)
+
+    cat_offsets = array('q', [0])
+    values = array('i')
+    for entity_cat_ids in entity_cats.values():
+        values.extend(entity_cat_ids)
+        cat_offsets.append(len(values))
+
+    return EntityCategories(StringTable.build(list(entity_cats.keys())), StringTable.build(list(cat_ids.keys())), cat_offsets, values)
+
+
+def write_taxonomy_snapshot(taxonomy, path):
+    snapshot.write_snapshot(path, 'taxonomy', taxonomy.to_sections(), meta={'num_cats': taxonomy.num_cats})
+
+
+def write_entity_cats_snapshot(entity_cats, path):
+    snapshot.write_snapshot(path, 'entity_cats', entity_cats.to_sections())
+
+
+def load_snapshot(path, kind):
+    header, sections = snapshot.open_snapshot(path)
+    if header['kind'] != kind:
+        raise ValueError('The snapshot {} contains {} data, expected {}.'.format(path, header['kind'], kind))
+
+    if kind == 'taxonomy':
+        return CategoryTaxonomy.from_sections(header, sections)
+    return EntityCategories.from_sections(header, sections)
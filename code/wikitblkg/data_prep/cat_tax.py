@@ -1,4 +1,6 @@
 class CatTax:
+    __slots__ = ('name', 'level', 'parents')
+
     def __init__(self, name, level):
         self.name = name
         self.level = level
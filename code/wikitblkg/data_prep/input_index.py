@@ -0,0 +1,166 @@
+'''
+    Byte-offset index over the TableNet input file (one entity JSON per line), which allows us to start reading at any
+    table ordinal without reading and parsing all the entity lines before it.
+
+    For every entity line we store its (uncompressed) byte offset and the number of tables before it. For gzipped input
+    we additionally store the access points of the file, i.e. the compressed and uncompressed offsets of every gzip
+    member, such that we only need to decompress from the start of the member that contains the entity line.
+'''
+
+import gzip
+import json
+import zlib
+from array import array
+from bisect import bisect_right
+
+from data_prep import snapshot
+
+
+def get_index_path(infile):
+    return infile + '.idx'
+
+
+'''
+    Iterate over the lines of the input file along with their uncompressed byte offsets. For gzipped files the start of
+    every gzip member is appended to the access points as (compressed offset, uncompressed offset).
+'''
+
+
+def __iter_lines(infile, access_points, chunk_size=1 << 20):
+    if not infile.endswith('gz'):
+        offset = 0
+        with open(infile, 'rb') as reader:
+            for line in reader:
+                yield offset, line
+                offset += len(line)
+        return
+
+    comp_offset = 0
+    uncomp_offset = 0
+    line_offset = 0
+    pending = []
+    decompressor = zlib.decompressobj(31)
+    access_points.append((0, 0))
+
+    with open(infile, 'rb') as reader:
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            chunk_start = comp_offset
+            comp_offset += len(chunk)
+
+            while chunk:
+                data = decompressor.decompress(chunk)
+                uncomp_offset += len(data)
+
+                # entity lines can span many chunks, hence, we only join the pending parts once the line is complete
+                if b'\n' not in data:
+                    pending.append(data)
+                else:
+                    lines = data.split(b'\n')
+                    pending.append(lines[0])
+                    lines[0] = b''.join(pending)
+                    pending = [lines.pop()]
+                    for line in lines:
+                        yield line_offset, line + b'\n'
+                        line_offset += len(line) + 1
+
+                if not decompressor.eof:
+                    break
+
+                # the member ended, the remaining data (if any besides padding) is the start of the next member
+                chunk_start += len(chunk) - len(decompressor.unused_data)
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(31)
+                if chunk.strip(b'\0'):
+                    access_points.append((chunk_start, uncomp_offset))
+                else:
+                    chunk = b''
+
+    pending = b''.join(pending)
+    if pending:
+        yield line_offset, pending
+
+
+'''
+    Build the index for the input file and write it next to the file.
+'''
+
+
+def build_input_index(infile):
+    access_points = []
+    line_offsets = array('q')
+    table_counts = array('q', [0])
+
+    num_tables = 0
+    for offset, line in __iter_lines(infile, access_points):
+        if not line.strip():
+            continue
+
+        entity_json = json.loads(line)
+        line_offsets.append(offset)
+        num_tables += sum(len(section['tables']) for section in entity_json['sections'])
+        table_counts.append(num_tables)
+
+    sections = {'line_offsets': line_offsets, 'table_counts': table_counts,
+                'ap_comp_offsets': array('q', [ap[0] for ap in access_points]),
+                'ap_uncomp_offsets': array('q', [ap[1] for ap in access_points])}
+    snapshot.write_snapshot(get_index_path(infile), 'input_index', sections, meta={'num_tables': num_tables, 'num_lines': len(line_offsets)})
+    return num_tables
+
+
+class InputIndex:
+    def __init__(self, infile, header, sections):
+        self.infile = infile
+        self.num_tables = header['meta']['num_tables']
+        self.line_offsets = sections['line_offsets']
+        self.table_counts = sections['table_counts']
+        self.ap_comp_offsets = sections['ap_comp_offsets']
+        self.ap_uncomp_offsets = sections['ap_uncomp_offsets']
+
+    '''
+        Return the index of the entity line that contains the table with the given (0-based) ordinal and the number of
+        tables that come before that line.
+    '''
+
+    def find_table(self, ordinal):
+        line_idx = bisect_right(self.table_counts, ordinal) - 1
+        line_idx = min(line_idx, len(self.line_offsets) - 1)
+        return line_idx, self.table_counts[line_idx]
+
+    '''
+        Iterate over the lines of the input file starting from the given entity line.
+    '''
+
+    def iter_lines_from(self, line_idx):
+        if line_idx >= len(self.line_offsets):
+            return
+        offset = self.line_offsets[line_idx]
+
+        if not self.infile.endswith('gz'):
+            with open(self.infile, 'rb') as reader:
+                reader.seek(offset)
+                yield from reader
+            return
+
+        ap_idx = bisect_right(self.ap_uncomp_offsets, offset) - 1
+        with open(self.infile, 'rb') as raw:
+            raw.seek(self.ap_comp_offsets[ap_idx])
+            with gzip.GzipFile(fileobj=raw, mode='rb') as reader:
+                reader.seek(offset - self.ap_uncomp_offsets[ap_idx])
+                yield from reader
+
+
+'''
+    Load the index of the input file if it exists and is newer than the input file, otherwise None.
+'''
+
+
+def load_input_index(infile):
+    index_path = get_index_path(infile)
+    if not snapshot.is_snapshot_fresh(infile, index_path):
+        return None
+
+    header, sections = snapshot.open_snapshot(index_path)
+    return InputIndex(infile, header, sections)
@@ -0,0 +1,126 @@
+'''
+    Input-driven pruning of the KG resources. The column typing only looks up the entities that appear as structured
+    values in the tables, hence, a pre-pass over the tables collects these entities, and only their categories and the
+    ancestors of these categories in the taxonomy are loaded. The pruned resources yield the same column types as the
+    full ones, while their size depends on the processed tables rather than on all of Wikipedia.
+'''
+
+import hashlib
+import os
+from array import array
+
+import data_utils as du
+from data_prep import cat_store, shared_store, snapshot
+from data_prep.cat_store import CategoryTaxonomy, StringTable
+
+
+def collect_entities(tables_file, start=0, limit=None):
+    entities = set()
+    for table, entity_label, section_label in du.iter_table_json(tables_file, start=start, limit=limit):
+        for row in table['rows']:
+            for cell in row['values']:
+                if 'structured_values' in cell:
+                    for struct_val in cell['structured_values']:
+                        entities.add(struct_val['structured'])
+    return entities
+
+
+def prune_entity_cats(ecats, entities):
+    pairs = []
+    for entity in sorted(entities):
+        idx = ecats.entities.find(entity)
+        if idx != -1:
+            pairs.extend((entity, category) for category in ecats.get_categories(idx))
+    return cat_store.encode_entity_cats(pairs)
+
+
+'''
+    Keep the categories of the entity categories along with all their ancestors. The categories keep their order in the
+    taxonomy, which breaks the ties between LCA categories of the same level, and the parents that are not part of the
+    taxonomy are kept as names only.
+'''
+
+
+def prune_taxonomy(tax, ecats):
+    num_cats = tax.num_cats
+    keep = bytearray(num_cats)
+    stack = []
+    for idx in range(len(ecats.categories)):
+        cat_id = tax.get_id(ecats.categories[idx])
+        if cat_id != -1 and not keep[cat_id]:
+            keep[cat_id] = 1
+            stack.append(cat_id)
+
+    while stack:
+        cat_id = stack.pop()
+        for pos in range(tax.parent_offsets[cat_id], tax.parent_offsets[cat_id + 1]):
+            parent_id = tax.parent_ids[pos]
+            if parent_id < num_cats and not keep[parent_id]:
+                keep[parent_id] = 1
+                stack.append(parent_id)
+
+    kept = [cat_id for cat_id in range(num_cats) if keep[cat_id]]
+    new_ids = {cat_id: idx for idx, cat_id in enumerate(kept)}
+    names = [tax.names[cat_id] for cat_id in kept]
+
+    parent_offsets = array('q', [0])
+    parent_ids = array('i')
+    parent_levels = array('i')
+    for cat_id in kept:
+        for pos in range(tax.parent_offsets[cat_id], tax.parent_offsets[cat_id + 1]):
+            parent_id = tax.parent_ids[pos]
+            if parent_id not in new_ids:
+                new_ids[parent_id] = len(names)
+                names.append(tax.names[parent_id])
+            parent_ids.append(new_ids[parent_id])
+            parent_levels.append(tax.parent_levels[pos])
+        parent_offsets.append(len(parent_ids))
+
+    levels = array('i', [tax.levels[cat_id] for cat_id in kept])
+    return CategoryTaxonomy(StringTable.build(names), len(kept), levels, parent_offsets, parent_ids, parent_levels)
+
+
+'''
+    The pruned resources are cached per tables range and version (path, size and modification time) of the input files.
+'''
+
+
+def get_cache_path(cache_dir, tables_file, start, limit, tax_path, ec_path):
+    key = hashlib.blake2b(digest_size=16)
+    for path in (tables_file, tax_path, ec_path):
+        stat = os.stat(path)
+        key.update('{}\t{:d}\t{:d}\n'.format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    key.update('{}\t{}\n'.format(start, limit).encode('utf-8'))
+    return os.path.join(cache_dir, 'pruned_{}.snap'.format(key.hexdigest()))
+
+
+'''
+    Load the taxonomy and entity categories pruned to the entities of the tables in [start, start + limit). The entity
+    categories are read from their snapshot if it is fresh, otherwise only the lines of the collected entities are kept
+    while parsing the TSV file. If a cache directory is given, the pruned resources (along with their ancestor closure)
+    are written into and loaded from there (see data_prep.shared_store).
+'''
+
+
+def load_pruned_resources(tables_file, tax_path, ec_path, start=0, limit=None, cache_dir=None):
+    cache_path = None if cache_dir is None else get_cache_path(cache_dir, tables_file, start, limit, tax_path, ec_path)
+    if cache_path is not None and os.path.isfile(cache_path):
+        print('Loading the pruned resources {}'.format(cache_path))
+        tax, ecats, _ = du.load_shared_resources(cache_path)
+        return tax, ecats
+
+    entities = collect_entities(tables_file, start=start, limit=limit)
+    print('Collected {:d} entities from the tables.'.format(len(entities)))
+
+    if snapshot.is_snapshot_fresh(ec_path):
+        ecats = prune_entity_cats(du.load_entity_cats(ec_path), entities)
+    else:
+        ecats = cat_store.build_entity_cats(ec_path, entities=entities)
+    tax = prune_taxonomy(du.load_flat_cat_tax(tax_path), ecats)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        sources = {'taxonomy': os.path.abspath(tax_path), 'entity_cat': os.path.abspath(ec_path)}
+        shared_store.write_resources(cache_path, tax, ecats, du.get_tax_index(tax), sources=sources)
+        print('Cached the pruned resources in {}'.format(cache_path))
+    return tax, ecats
@@ -0,0 +1,109 @@
+'''
+    Single-pass random sampling of the tables. Every table gets a random key (drawn from a fixed seed), and a sample of
+    size k keeps the k tables with the lowest keys, i.e. a uniform random sample (bottom-k reservoir sampling). Only the
+    sampled tables are kept in memory, and they are returned in their input order.
+
+    With strata (the section or the size of a table), the sample is shared fairly between the strata: once the sample is
+    full, a table of a smaller stratum evicts the table with the highest key of the largest stratum. Hence, the strata
+    with few tables are kept entirely and the others get equal shares of the rest. Within a stratum the sample stays
+    uniform, since a stratum never accepts a table whose key is higher than a key it has already dropped.
+'''
+
+import heapq
+import random
+
+
+def get_section_stratum(table, entity_label, section_label):
+    return section_label
+
+
+'''
+    The size strata are the powers of two of the number of rows, i.e. 1, 2-3, 4-7, 8-15 rows and so on.
+'''
+
+
+def get_size_stratum(table, entity_label, section_label):
+    return len(table['rows']).bit_length()
+
+
+STRATA = {'section': get_section_stratum, 'size': get_size_stratum}
+
+
+class TableSampler:
+    def __init__(self, sample_size, stratify=None, seed=10):
+        if stratify is not None and stratify not in STRATA:
+            raise ValueError('Unknown strata {}, expected one of {}.'.format(stratify, ', '.join(STRATA)))
+        self.sample_size = sample_size
+        self.get_stratum = None if stratify is None else STRATA[stratify]
+        self.random = random.Random(seed)
+        self.num_seen = 0
+        self.num_sampled = 0
+
+        # stratum -> heap of (-key, ordinal, table), i.e. the table with the highest key is on top
+        self.strata = {}
+        # stratum -> the lowest key the stratum has dropped
+        self.thresholds = {}
+        # size -> strata of this size (as an ordered dict, such that the evictions are deterministic)
+        self.sizes = {}
+        self.max_size = 0
+
+    def add(self, table, entity_label, section_label):
+        key = self.random.random()
+        ordinal = self.num_seen
+        self.num_seen += 1
+
+        stratum = None if self.get_stratum is None else self.get_stratum(table, entity_label, section_label)
+        if self.sample_size <= 0 or key >= self.thresholds.get(stratum, 1.0):
+            return
+        item = (-key, ordinal, (table, entity_label, section_label))
+
+        heap = self.strata.setdefault(stratum, [])
+        if self.num_sampled < self.sample_size:
+            heapq.heappush(heap, item)
+            self.__resize(stratum, len(heap) - 1)
+            self.num_sampled += 1
+        elif len(heap) == self.max_size:
+            # the stratum is one of the largest, hence, the table can only replace a table of the stratum itself
+            if item > heap[0]:
+                self.__drop(stratum, -heapq.heapreplace(heap, item)[0])
+            else:
+                self.__drop(stratum, key)
+        else:
+            victim = next(iter(self.sizes[self.max_size]))
+            self.__drop(victim, -heapq.heappop(self.strata[victim])[0])
+            self.__resize(victim, self.max_size)
+            heapq.heappush(heap, item)
+            self.__resize(stratum, len(heap) - 1)
+
+    def __drop(self, stratum, key):
+        self.thresholds[stratum] = min(key, self.thresholds.get(stratum, 1.0))
+
+    def __resize(self, stratum, old_size):
+        new_size = len(self.strata[stratum])
+        if old_size:
+            strata = self.sizes[old_size]
+            del strata[stratum]
+            if not strata:
+                del self.sizes[old_size]
+                if old_size == self.max_size:
+                    self.max_size = new_size
+        if new_size:
+            self.sizes.setdefault(new_size, {})[stratum] = None
+        self.max_size = max(self.max_size, new_size)
+
+    '''
+        Return the sampled tables in their input order.
+    '''
+
+    def get_sample(self):
+        items = [item for heap in self.strata.values() for item in heap]
+        items.sort(key=lambda item: item[1])
+        return [item[2] for item in items]
+
+
+def sample_tables(tables, sample_size, stratify=None, seed=10):
+    sampler = TableSampler(sample_size, stratify=stratify, seed=seed)
+    for table, entity_label, section_label in tables:
+        sampler.add(table, entity_label, section_label)
+    print('Sampled {:d} of {:d} tables.'.format(sampler.num_sampled, sampler.num_seen))
+    return sampler.get_sample()
@@ -0,0 +1,61 @@
+'''
+    The KG resources, i.e. the integer-encoded taxonomy, its ancestor closure and the entity categories, in a single
+    snapshot. Processes memory-map the snapshot read-only, hence, its pages are shared through the page cache: N worker
+    processes keep a single copy of the resources in memory and none of them recomputes the closure. Only the path of
+    the snapshot is handed over to the workers, which works with any start method of multiprocessing.
+'''
+
+import os
+import tempfile
+
+from data_prep import snapshot
+from data_prep.cat_store import CategoryTaxonomy, EntityCategories
+from data_prep.tax_index import TaxIndex
+
+KIND = 'kg_resources'
+
+
+'''
+    A RAM-backed directory for temporary resource snapshots, if the system has one.
+'''
+
+
+def get_shared_dir():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+'''
+    The sources are the paths of the taxonomy and entity category files the resources were built from.
+'''
+
+
+def write_resources(path, tax, ecats, tax_index, sources=None):
+    if not isinstance(tax, CategoryTaxonomy) or not isinstance(ecats, EntityCategories):
+        raise ValueError('Only the integer-encoded taxonomy and entity categories (see data_prep.cat_store) can be shared.')
+
+    sections = tax.to_sections()
+    sections.update(ecats.to_sections())
+    sections.update(tax_index.to_sections())
+    snapshot.write_snapshot(path, KIND, sections, meta={'num_cats': tax.num_cats, 'sources': {} if sources is None else sources})
+
+
+'''
+    Write the resources into a temporary snapshot in the shared directory, which the caller removes once the workers are done.
+'''
+
+
+def create_resources(tax, ecats, tax_index, sources=None):
+    fd, path = tempfile.mkstemp(prefix='wikitblkg_resources_', suffix='.snap', dir=get_shared_dir())
+    os.close(fd)
+    write_resources(path, tax, ecats, tax_index, sources=sources)
+    return path
+
+
+def load_resources(path):
+    header, sections = snapshot.open_snapshot(path)
+    if header['kind'] != KIND:
+        raise ValueError('The snapshot {} contains {} data, expected {}.'.format(path, header['kind'], KIND))
+
+    tax = CategoryTaxonomy.from_sections(header, sections)
+    ecats = EntityCategories.from_sections(header, sections)
+    return tax, ecats, TaxIndex.from_sections(tax, sections), header['meta']['sources']
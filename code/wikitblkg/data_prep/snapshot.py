@@ -0,0 +1,109 @@
+'''
+    Binary snapshots of integer-encoded data. A snapshot is a single file with a small JSON header, followed by the raw
+    arrays, which are memory-mapped when the snapshot is opened, i.e. nothing has to be parsed at startup.
+
+    Layout: MAGIC | header length (uint64) | JSON header | padding | arrays (each aligned to 8 bytes)
+'''
+
+import json
+import mmap
+import os
+import struct
+
+MAGIC = b'WTKGSNAP'
+VERSION = 1
+ALIGN = 8
+
+
+def get_snapshot_path(source_path):
+    return source_path + '.snap'
+
+
+'''
+    A snapshot is only used if it is newer than the source file it has been compiled from.
+'''
+
+
+def is_snapshot_fresh(source_path, snapshot_path=None):
+    snapshot_path = get_snapshot_path(source_path) if snapshot_path is None else snapshot_path
+    if not os.path.isfile(snapshot_path):
+        return False
+    return os.path.getmtime(snapshot_path) >= os.path.getmtime(source_path)
+
+
+def __padding(size):
+    return (ALIGN - size % ALIGN) % ALIGN
+
+
+'''
+    Write the snapshot. The sections are either array.array objects, bytes or memoryviews (e.g. the sections of another
+    snapshot). The file is written to a temporary path and renamed at the end, such that readers never see a partially
+    written snapshot.
+'''
+
+
+def write_snapshot(path, kind, sections, meta=None):
+    header = {'version': VERSION, 'kind': kind, 'meta': {} if meta is None else meta, 'sections': {}}
+
+    offset = 0
+    sizes = []
+    for name, data in sections.items():
+        if isinstance(data, (bytes, bytearray)):
+            typecode, size = 'B', len(data)
+        else:
+            typecode = data.format if isinstance(data, memoryview) else data.typecode
+            size = len(data) * data.itemsize
+        header['sections'][name] = [offset, typecode, len(data)]
+        sizes.append(size)
+        offset += size + __padding(size)
+
+    header_str = json.dumps(header).encode('utf-8')
+    data_start = len(MAGIC) + 8 + len(header_str)
+    data_start += __padding(data_start)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fout:
+        fout.write(MAGIC)
+        fout.write(struct.pack('<Q', len(header_str)))
+        fout.write(header_str)
+        fout.write(b'\0' * (data_start - fout.tell()))
+
+        # all the sections support the buffer protocol, hence, they are written without copying them
+        for data, size in zip(sections.values(), sizes):
+            fout.write(data)
+            fout.write(b'\0' * __padding(size))
+    os.replace(tmp_path, path)
+
+
+'''
+    Read the snapshot header and the sections from any buffer (e.g. a memory-mapped file), without copying the data.
+'''
+
+
+def read_snapshot_buffer(buffer):
+    view = memoryview(buffer)
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError('The data is not a WikiTablesKG snapshot.')
+
+    header_len = struct.unpack('<Q', view[len(MAGIC):len(MAGIC) + 8])[0]
+    header_end = len(MAGIC) + 8 + header_len
+    header = json.loads(bytes(view[len(MAGIC) + 8:header_end]).decode('utf-8'))
+    if header['version'] != VERSION:
+        raise ValueError('Unsupported snapshot version {}.'.format(header['version']))
+
+    data_start = header_end + __padding(header_end)
+    sections = {}
+    for name, (offset, typecode, length) in header['sections'].items():
+        start = data_start + offset
+        if typecode == 'B':
+            sections[name] = view[start:start + length]
+        else:
+            itemsize = struct.calcsize(typecode)
+            sections[name] = view[start:start + length * itemsize].cast(typecode)
+    return header, sections
+
+
+def open_snapshot(path):
+    with open(path, 'rb') as fin:
+        buffer = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+    return read_snapshot_buffer(buffer)
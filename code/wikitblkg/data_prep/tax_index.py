@@ -0,0 +1,268 @@
+'''
+    Precomputed ancestor closure of the flat category taxonomy, which we use to find the LCA categories of the entities
+    in a column without walking the taxonomy for every entity again.
+'''
+
+from array import array
+
+from data_prep.cat_store import CategoryTaxonomy, EntityCategories
+from metrics import metrics
+
+
+class TaxIndex:
+    def __init__(self, taxonomy, entity_cache_size=1000000, closure=None, max_entities=None, patience=None):
+        self.taxonomy = taxonomy
+
+        # bounds of the evidence per column (see find_lca_category), by default all the entities are used
+        self.max_entities = max_entities
+        self.patience = patience
+
+        # compact integer IDs for the categories, assigned in the order of the taxonomy. The integer-encoded taxonomy
+        # already comes with its IDs, otherwise we intern the category names here.
+        self.cat_ids = None
+        self.cat_names = []
+        self.cat_levels = array('i')
+
+        # for the integer-encoded entity categories, we map their category IDs to the taxonomy IDs (-2 if not mapped yet).
+        self.ecat_tax_ids = None
+
+        # the ancestors of a category (including itself) are stored in anc_values[anc_start[id]:anc_end[id]]
+        self.anc_start = array('q')
+        self.anc_end = array('q')
+        self.anc_values = array('i')
+
+        # memoized ancestor sets of the entities, which are only valid for the same entity categories.
+        self.entity_cache_size = entity_cache_size
+        self.entity_ancestors = {}
+        self.ecats = None
+
+        self.__build_ids()
+        if closure is None:
+            self.__build_closure()
+        else:
+            # a precomputed closure, e.g. memory-mapped from the shared KG resources (see data_prep.shared_store)
+            self.anc_start, self.anc_end, self.anc_values = closure
+
+    def __len__(self):
+        return len(self.anc_start)
+
+    def __build_ids(self):
+        if isinstance(self.taxonomy, CategoryTaxonomy):
+            self.cat_names = self.taxonomy.names
+            self.cat_levels = self.taxonomy.levels
+            return
+
+        self.cat_ids = {}
+        for cat_name in self.taxonomy:
+            self.cat_ids[cat_name] = len(self.cat_names)
+            self.cat_names.append(cat_name)
+            self.cat_levels.append(self.taxonomy[cat_name].level)
+
+    def to_sections(self):
+        return {'anc_start': self.anc_start, 'anc_end': self.anc_end, 'anc_values': self.anc_values}
+
+    @staticmethod
+    def from_sections(taxonomy, sections):
+        return TaxIndex(taxonomy, closure=(sections['anc_start'], sections['anc_end'], sections['anc_values']))
+
+    def get_cat_id(self, cat_name):
+        if self.cat_ids is None:
+            cat_id = self.taxonomy.get_id(cat_name)
+            return None if cat_id == -1 else cat_id
+        return self.cat_ids.get(cat_name)
+
+    '''
+        Parent categories that are not part of the taxonomy (i.e. the root categories) are never part of the ancestors.
+    '''
+
+    def __parent_ids(self, cat_id):
+        if self.cat_ids is None:
+            tax = self.taxonomy
+            parent_ids = tax.parent_ids
+            return [parent_ids[pos] for pos in range(tax.parent_offsets[cat_id], tax.parent_offsets[cat_id + 1]) if parent_ids[pos] < tax.num_cats]
+
+        parents = []
+        for parent in self.taxonomy[self.cat_names[cat_id]].parents:
+            parent_id = self.cat_ids.get(parent.name)
+            if parent_id is not None:
+                parents.append(parent_id)
+        return parents
+
+    '''
+        Compute the ancestor closure iteratively. The taxonomy is not guaranteed to be acyclic, hence, we first compute the
+        strongly connected components (Tarjan), which are emitted such that all the components reachable from a component
+        are emitted before it. The closure of a component is then its members plus the closure of its parent components.
+    '''
+
+    def __build_closure(self):
+        num_cats = len(self.taxonomy)
+        self.anc_start = array('q', [0]) * num_cats
+        self.anc_end = array('q', [0]) * num_cats
+
+        index = array('q', [-1]) * num_cats
+        low_link = array('q', [0]) * num_cats
+        on_stack = bytearray(num_cats)
+        scc_stack = []
+        counter = 0
+
+        for root in range(num_cats):
+            if index[root] != -1:
+                continue
+
+            work = [(root, self.__parent_ids(root), 0)]
+            index[root] = low_link[root] = counter
+            counter += 1
+            scc_stack.append(root)
+            on_stack[root] = 1
+
+            while work:
+                cat_id, parents, pos = work[-1]
+                if pos < len(parents):
+                    work[-1] = (cat_id, parents, pos + 1)
+                    parent_id = parents[pos]
+                    if index[parent_id] == -1:
+                        index[parent_id] = low_link[parent_id] = counter
+                        counter += 1
+                        scc_stack.append(parent_id)
+                        on_stack[parent_id] = 1
+                        work.append((parent_id, self.__parent_ids(parent_id), 0))
+                    elif on_stack[parent_id]:
+                        low_link[cat_id] = min(low_link[cat_id], index[parent_id])
+                    continue
+
+                work.pop()
+                if work:
+                    child_id = work[-1][0]
+                    low_link[child_id] = min(low_link[child_id], low_link[cat_id])
+
+                if low_link[cat_id] == index[cat_id]:
+                    component = []
+                    while True:
+                        member = scc_stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == cat_id:
+                            break
+                    self.__add_component_closure(component)
+
+    def __add_component_closure(self, component):
+        closure = set(component)
+        for cat_id in component:
+            for parent_id in self.__parent_ids(cat_id):
+                if parent_id not in closure:
+                    closure.update(self.anc_values[self.anc_start[parent_id]:self.anc_end[parent_id]])
+
+        start = len(self.anc_values)
+        self.anc_values.extend(sorted(closure))
+        end = len(self.anc_values)
+        for cat_id in component:
+            self.anc_start[cat_id] = start
+            self.anc_end[cat_id] = end
+
+    '''
+        Return the IDs of all the categories of an entity and their ancestors, or None if the entity has no categories.
+        The result is memoized per entity.
+    '''
+
+    def get_entity_ancestors(self, entity, e_cats):
+        if e_cats is not self.ecats:
+            self.ecats = e_cats
+            self.entity_ancestors.clear()
+            self.ecat_tax_ids = array('i', [-2]) * len(e_cats.categories) if isinstance(e_cats, EntityCategories) else None
+
+        if entity in self.entity_ancestors:
+            return self.entity_ancestors[entity]
+
+        if entity not in e_cats:
+            ancestors = None
+        else:
+            ancestors = frozenset(self.__load_entity_ancestors(entity, e_cats))
+
+        if len(self.entity_ancestors) >= self.entity_cache_size:
+            self.entity_ancestors.clear()
+        self.entity_ancestors[entity] = ancestors
+        return ancestors
+
+    def __load_entity_ancestors(self, entity, e_cats):
+        ancestors = set()
+        for cat_id in self.__entity_cat_ids(entity, e_cats):
+            if cat_id in ancestors:
+                continue
+            ancestors.update(self.anc_values[self.anc_start[cat_id]:self.anc_end[cat_id]])
+        return ancestors
+
+    def __entity_cat_ids(self, entity, e_cats):
+        if self.ecat_tax_ids is None:
+            cat_ids = (self.get_cat_id(cat_name) for cat_name in e_cats[entity])
+            return [cat_id for cat_id in cat_ids if cat_id is not None]
+
+        idx = e_cats.entities.find(entity)
+        cat_ids = []
+        for pos in range(e_cats.cat_offsets[idx], e_cats.cat_offsets[idx + 1]):
+            ecat_id = e_cats.cat_ids[pos]
+            cat_id = self.ecat_tax_ids[ecat_id]
+            if cat_id == -2:
+                cat_id = self.get_cat_id(e_cats.categories[ecat_id])
+                cat_id = self.ecat_tax_ids[ecat_id] = -1 if cat_id is None else cat_id
+            if cat_id != -1:
+                cat_ids.append(cat_id)
+        return cat_ids
+
+    '''
+        Find the lowest (i.e. with the highest level) category that is common to all the entities that have categories.
+        Ties between categories of the same level are broken by the order of the categories in the taxonomy.
+
+        The ancestor sets are intersected entity by entity, where repeated entities are skipped and we stop as soon as
+        the common categories are empty. The evidence per column can further be bounded, in which case the result is
+        an approximation:
+            max_entities    only a deterministic sample of this many distinct entities (evenly spaced over the column)
+            patience        stop once this many consecutive entities with categories did not change the common categories
+    '''
+
+    def find_lca_category(self, seed_entities, e_cats):
+        entities = list(dict.fromkeys(seed_entities))
+        capped = self.max_entities is not None and len(entities) > self.max_entities
+        if capped:
+            stride = len(entities) / self.max_entities
+            entities = [entities[int(idx * stride)] for idx in range(self.max_entities)]
+
+        common_cats = None
+        evaluated = 0
+        unchanged = 0
+        exit_reason = None
+        for entity in entities:
+            ancestors = self.get_entity_ancestors(entity, e_cats)
+            if ancestors is None:
+                continue
+
+            evaluated += 1
+            if common_cats is None:
+                common_cats = set(ancestors)
+                continue
+
+            num_common = len(common_cats)
+            common_cats.intersection_update(ancestors)
+            if len(common_cats) == 0:
+                exit_reason = 'lca_empty_exits'
+                break
+
+            unchanged = unchanged + 1 if len(common_cats) == num_common else 0
+            if self.patience is not None and unchanged >= self.patience:
+                exit_reason = 'lca_stable_exits'
+                break
+
+        if metrics.enabled:
+            metrics.count('lca_columns')
+            metrics.count('lca_entities', len(seed_entities))
+            metrics.count('lca_evaluated_entities', evaluated)
+            if capped:
+                metrics.count('lca_capped_columns')
+            if exit_reason is not None:
+                metrics.count(exit_reason)
+
+        if not common_cats:
+            return []
+
+        levels = self.cat_levels
+        val = max(common_cats, key=lambda cat_id: (levels[cat_id], -cat_id))
+        return [self.cat_names[val]]
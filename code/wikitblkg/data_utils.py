@@ -1,10 +1,12 @@
+import argparse
 import gzip
 import json
-from operator import itemgetter
 import random
 
-from data_prep.cat_tax import CatTax
+from data_prep import cat_store, input_index, sampling, shared_store, snapshot
 from data_prep.table import Table
+from data_prep.tax_index import TaxIndex
+from metrics import metrics
 
 '''
     Load the tables data.
@@ -13,27 +15,85 @@ from data_prep.table import Table
 random.seed(10)
 
 
-def load_tables(infile, start=0, limit=None, random_sample=False, tax=None, ecats=None):
-    print('Loading tables from file {} with sampling {}'.format(infile, str(random_sample)))
-    if infile.endswith('gz'):
-        reader = gzip.open(infile, 'r')
-    else:
-        reader = open(infile, 'r')
-
+def load_tables(infile, start=0, limit=None, random_sample=False, tax=None, ecats=None, stratify=None, seed=10):
     # read the tables data
     tables = {}
-    count = 0
-    loaded_tables = 0
-    for line in reader:
-        # parse the entity table json
+    for tbl_obj in iter_tables(infile, start=start, limit=limit, random_sample=random_sample, tax=tax, ecats=ecats, stratify=stratify, seed=seed):
+        tables[tbl_obj.table_id] = tbl_obj
+    return tables
+
+
+'''
+    Stream the tables data. The tables are parsed and typed one at a time, such that only the current table is kept in
+    memory. With random_sample, the tables are a random sample (see select_table_json), of which only the raw JSONs are
+    kept in memory.
+'''
+
+
+def iter_tables(infile, start=0, limit=None, random_sample=False, tax=None, ecats=None, stratify=None, seed=10):
+    print('Loading tables from file {} with sampling {}'.format(infile, str(random_sample)))
+    for table, entity_label, section_label in select_table_json(infile, start=start, limit=limit, random_sample=random_sample, stratify=stratify, seed=seed):
+        yield load_table(table, entity_label, section_label, tax=tax, ecats=ecats)
+
+
+def load_table(table, entity_label, section_label, tax=None, ecats=None):
+    with metrics.stage('load_json'):
+        tbl_obj = Table(flat_taxonomy=tax, ecats=ecats)
+        tbl_obj.load_json(table, entity_label, section_label)
+    return tbl_obj
+
+
+'''
+    Open the entity lines of the tables file. Returns the line reader along with the number of tables in the lines that
+    are skipped, i.e. if the file has been indexed (see data_prep.input_index), the reader starts at the entity line that
+    contains the start table.
+'''
+
+
+def open_table_lines(infile, start=0):
+    index = input_index.load_input_index(infile) if start > 1 else None
+    if index is not None:
+        line_idx, count = index.find_table(start - 1)
+        return index.iter_lines_from(line_idx), count
+    elif infile.endswith('gz'):
+        return gzip.open(infile, 'r'), 0
+    return open(infile, 'r'), 0
+
+
+'''
+    Parse an entity line into its tables along with their entity and section labels.
+'''
+
+
+def parse_table_line(line):
+    # parse the entity table json
+    with metrics.stage('json_decode'):
         entity_json = json.loads(line.strip())
-        entity_label = entity_json['entity']
+    metrics.count('json_lines')
+    entity_label = entity_json['entity']
+
+    # iterate through the sections
+    for section in entity_json['sections']:
+        section_label = section['section']
+
+        for table in section['tables']:
+            yield table, entity_label, section_label
+
+
+'''
+    Iterate over the raw table JSONs along with their entity and section labels. Tables with an ordinal (starting at 1)
+    lower than start are skipped, and at most limit tables are returned. If the input file has been indexed (see
+    data_prep.input_index), we directly seek to the entity line that contains the start table.
+'''
 
-        # iterate through the sections
-        for section in entity_json['sections']:
-            section_label = section['section']
 
-            for table in section['tables']:
+def iter_table_json(infile, start=0, limit=None):
+    reader, count = open_table_lines(infile, start=start)
+
+    loaded_tables = 0
+    try:
+        for line in reader:
+            for table, entity_label, section_label in parse_table_line(line):
                 count += 1
                 if count < start:
                     continue
@@ -41,30 +101,104 @@ def load_tables(infile, start=0, limit=None, random_sample=False, tax=None, ecat
                 loaded_tables += 1
                 # do not load more than the set limit
                 if limit is not None and loaded_tables > limit:
-                    return tables
+                    return
 
-                tbl_obj = Table(flat_taxonomy=tax, ecats=ecats)
-                tbl_obj.load_json(table, entity_label, section_label)
+                yield table, entity_label, section_label
+    finally:
+        reader.close()
 
-                tables[tbl_obj.table_id] = tbl_obj
-    return tables
+
+'''
+    Select the raw table JSONs: either the tables [start, start + limit), or with random_sample, a random sample of limit
+    tables among all the tables from start on, which are read in a single pass and returned in their input order (see
+    data_prep.sampling). The sample is optionally stratified by the section or size of the tables.
+'''
+
+
+def select_table_json(infile, start=0, limit=None, random_sample=False, stratify=None, seed=10):
+    if not random_sample or limit is None:
+        return iter_table_json(infile, start=start, limit=limit)
+    return sampling.sample_tables(iter_table_json(infile, start=start), limit, stratify=stratify, seed=seed)
 
 
 '''
-   Load the parents of a category up to the root.
+   Load the parents of a category up to the root. The taxonomy is traversed iteratively (depth-first), such that deep
+   hierarchies do not hit the recursion limit.
 '''
 
 
 def load_cat_parents(taxonomy, cat_name, parents, visited_cats):
-    if cat_name not in taxonomy or cat_name in visited_cats:
-        return
+    stack = [cat_name]
+    while stack:
+        cat_name = stack.pop()
+        if cat_name not in taxonomy or cat_name in visited_cats:
+            continue
+
+        cat = taxonomy[cat_name]
+        parents.append((cat.name, cat.level))
+        visited_cats.add(cat.name)
+
+        stack.extend(parent.name for parent in reversed(list(cat.parents)))
+
+
+'''
+    The argparse type of the options that have to be positive, e.g. the LCA options.
+'''
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('{} is not a positive number'.format(value))
+    return number
+
+
+'''
+    Return the precomputed ancestor closure index of the taxonomy. The index is built once and reused as long as the
+    same taxonomy is passed. The LCA options (see TaxIndex.find_lca_category) apply to the cached index.
+'''
+
+tax_index_cache = []
+lca_options = {'max_entities': None, 'patience': None}
+
+
+def get_tax_index(taxonomy):
+    if isinstance(taxonomy, TaxIndex):
+        return taxonomy
 
-    cat = taxonomy[cat_name]
-    parents.append((cat.name, cat.level))
-    visited_cats.add(cat.name)
+    if len(tax_index_cache) == 0 or tax_index_cache[0].taxonomy is not taxonomy:
+        cache_tax_index(TaxIndex(taxonomy))
+    return tax_index_cache[0]
 
-    for parent in cat.parents:
-        load_cat_parents(taxonomy, parent.name, parents, visited_cats)
+
+def cache_tax_index(tax_index):
+    tax_index.max_entities = lca_options['max_entities']
+    tax_index.patience = lca_options['patience']
+    tax_index_cache.clear()
+    tax_index_cache.append(tax_index)
+
+
+def set_lca_options(max_entities=None, patience=None):
+    for name, value in (('max_entities', max_entities), ('patience', patience)):
+        if value is not None and value < 1:
+            raise ValueError('The LCA option {} must be a positive number, got {}.'.format(name, value))
+    lca_options['max_entities'] = max_entities
+    lca_options['patience'] = patience
+    for tax_index in tax_index_cache:
+        tax_index.max_entities = max_entities
+        tax_index.patience = patience
+
+
+'''
+    Load the taxonomy and entity categories from the shared KG resources (see data_prep.shared_store), whose ancestor
+    closure is used as the index of the taxonomy instead of computing it again.
+'''
+
+
+def load_shared_resources(path):
+    tax, ecats, tax_index, sources = shared_store.load_resources(path)
+    cache_tax_index(tax_index)
+    return tax, ecats, sources
 
 
 '''
@@ -77,69 +211,37 @@ def find_lca_category(taxonomy, seed_entities, e_cats):
     if seed_entities is None or len(seed_entities) == 0:
         return []
 
-    entity_tax_parents = {}
-    for entity in seed_entities:
-        if entity not in e_cats:
-            continue
-        entity_tax_parents[entity] = []
-        visited_cats = set()
-        for cat_name in e_cats[entity]:
-            load_cat_parents(taxonomy, cat_name, entity_tax_parents[entity], visited_cats)
-
-    # find the common categories
-    common_cats = set()
-    for idx, entity in enumerate(entity_tax_parents):
-        if idx == 0:
-            common_cats = set(entity_tax_parents[entity])
-            continue
-        common_cats.intersection(entity_tax_parents[entity])
-
-    if len(common_cats) == 0:
-        return []
-
-    # get the lowest matching category
-    if len(common_cats) != 0:
-        val = max(common_cats, key=itemgetter(1))
-        return [val[0]]
-
-    return []
+    # the ancestors of each entity come from the precomputed closure, such that finding the common categories is only
+    # a matter of intersecting the entity ancestor sets.
+    with metrics.stage('column_typing'):
+        return get_tax_index(taxonomy).find_lca_category(seed_entities, e_cats)
 
 
 '''
-    Load the category taxonomy where each node has contains its parents
+    Load the category taxonomy where each node has contains its parents. The taxonomy is integer-encoded (see
+    data_prep.cat_store) and has the same lookup interface as a dictionary of category name -> CatTax. If a compiled
+    snapshot of the taxonomy (see compile_snapshot.py) is newer than the TSV file, the snapshot is memory-mapped instead
+    of parsing the TSV file.
 '''
 
 
 def load_flat_cat_tax(tax_path):
-    taxonomy = {}
-
-    for line in gzip.open(tax_path, 'rt', encoding='latin_1'):
-        data = line.strip().lower().split('\t')
+    if snapshot.is_snapshot_fresh(tax_path):
+        print('Loading the taxonomy snapshot {}'.format(snapshot.get_snapshot_path(tax_path)))
+        return cat_store.load_snapshot(snapshot.get_snapshot_path(tax_path), 'taxonomy')
 
-        cat_child = CatTax(data[2], int(data[3]))
-        cat_parent = CatTax(data[0], int(data[1]))
-
-        if cat_child.name not in taxonomy:
-            taxonomy[cat_child.name] = cat_child
-            cat_child.add_parent(cat_parent)
-        else:
-            taxonomy[cat_child.name].add_parent(cat_parent)
-    return taxonomy
+    return cat_store.build_taxonomy(tax_path)
 
 
 '''
-    Loads the entity categories.
+    Loads the entity categories, integer-encoded with the same lookup interface as a dictionary of entity -> category
+    names. Similarly to the taxonomy, a fresh compiled snapshot is used if present.
 '''
 
 
 def load_entity_cats(ec_path):
-    entity_cats = {}
-    for line in gzip.open(ec_path, 'rt', encoding='latin_1'):
-        data = line.strip().lower().split('\t')
-        if len(data) != 2:
-            continue
+    if snapshot.is_snapshot_fresh(ec_path):
+        print('Loading the entity categories snapshot {}'.format(snapshot.get_snapshot_path(ec_path)))
+        return cat_store.load_snapshot(snapshot.get_snapshot_path(ec_path), 'entity_cats')
 
-        if data[0] not in entity_cats:
-            entity_cats[data[0]] = []
-        entity_cats[data[0]].append(data[1])
-    return entity_cats
+    return cat_store.build_entity_cats(ec_path)
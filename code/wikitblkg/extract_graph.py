@@ -1,5 +1,18 @@
 import argparse
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool
+
 import data_utils as du
+import incremental
+from data_prep import pruning, shared_store
+from kg_index import KGIndexWriter
+from kg_stats import KGStats, PER_TABLE_FILES, concat_part_files, get_memory_budget
+from metrics import metrics
+from nt_writer import COMPRESSIONS, load_checkpoint
+from pipeline import TablePipeline
+from sinks import KGStatsSink, TableStatsSink
 from tbl_kg_mapper import Tbl2KgMapper
 
 '''
@@ -14,30 +27,338 @@ def get_arguments():
     parser.add_argument('-o', '--out_dir', help='The output directory for storing the embeddings.', required=True)
     parser.add_argument('-t', '--taxonomy', help='The path to the flat category taxonomy.', required=True)
     parser.add_argument('-ec', '--entity_cat', help='The path to the entity category associations.', required=True)
+    parser.add_argument('-sr', '--shared_resources', help='The shared KG resources (see compile_snapshot.py -r), which are memory-mapped instead of loading the taxonomy and entity categories.', required=False)
+    parser.add_argument('-pr', '--prune', help='Only load the categories of the entities in the tables (collected in a pre-pass) and their ancestors in the taxonomy.', action='store_true')
+    parser.add_argument('-pc', '--prune_cache', help='Cache the pruned taxonomy and entity categories in this directory.', required=False)
+    parser.add_argument('-lm', '--lca_max_entities', help='Type a column with at most this many distinct entities (an evenly spaced sample of the column).', type=du.positive_int, default=None)
+    parser.add_argument('-lp', '--lca_patience', help='Stop typing a column once this many consecutive entities did not change its common categories.', type=du.positive_int, default=None)
     parser.add_argument('-gt', '--ground_truth', help='The ground-truth table pairs.', required=False)
     parser.add_argument('-s', '--start_offset', help='The start offset for loading the tables', type=int, default=0)
+    parser.add_argument('-rs', '--random_sample', help='Export a random sample of -dl tables among all the tables from the start offset on, instead of the first -dl tables.', action='store_true')
+    parser.add_argument('-ss', '--stratify', help='Stratify the random sample by the section or the size (number of rows) of the tables.', choices=['section', 'size'], default=None)
+    parser.add_argument('-sd', '--seed', help='The seed of the random sample.', type=int, default=10)
     parser.add_argument('-sf', '--file_suffix', help='The file suffix')
-    return parser.parse_args()
+    parser.add_argument('-w', '--workers', help='The number of worker processes. The tables are split into as many shards, each written into its own file.', type=int, default=1)
+    parser.add_argument('-c', '--compression', help='The compression of the N-Triples output files.', choices=list(COMPRESSIONS), default='none')
+    parser.add_argument('-mfs', '--max_file_size', help='The maximum size (in MB) of an output file, after which the output continues in a new file.', type=int, default=None)
+    parser.add_argument('-of', '--output_format', help='Write the KG as N-Triples (nt) or as dictionary-encoded triples (dict).', choices=['nt', 'dict'], default='nt')
+    parser.add_argument('-ci', '--checkpoint_interval', help='Write a checkpoint of the N-Triples output every this many tables.', type=int, default=10000)
+    parser.add_argument('-r', '--resume', help='Resume an interrupted run with the same arguments from its last checkpoint.', action='store_true')
+    parser.add_argument('-inc', '--incremental', help='Only write the tables that are new or have changed since the last incremental run (see the manifest in out_dir) into the file suffix shard.', action='store_true')
+    parser.add_argument('-mr', '--metrics_report', help='Collect metrics of the stages and write them into this JSON report (with -w, one report per shard).', required=False)
+    parser.add_argument('-st', '--slow_tables', help='The number of slowest tables in the metrics report.', type=int, default=20)
+    parser.add_argument('-pe', '--profile_every', help='Profile every n-th table with cProfile, the stats are written next to the metrics report.', type=int, default=0)
+    parser.add_argument('-p', '--pipeline', help='Read, map and write the tables in separate threads connected by bounded queues.', action='store_true')
+    parser.add_argument('-pw', '--pipeline_workers', help='The number of threads that parse and map the tables in the pipeline.', type=int, default=1)
+    parser.add_argument('-qs', '--queue_size', help='The maximum number of entity lines in each of the pipeline queues.', type=int, default=64)
+    parser.add_argument('-im', '--in_memory', help='Load all the tables into memory before writing them, instead of streaming them one at a time.', action='store_true')
+    parser.add_argument('-ts', '--table_stats', help='Write the column statistics of table_stats.py into this directory, in the same pass as the KG.', required=False)
+    parser.add_argument('-ks', '--kg_stats', help='Write the statistics of kg_stats.py (-f a) into this directory, in the same pass as the KG.', required=False)
+    parser.add_argument('-mb', '--memory_budget', help='Keep the exact cell value and column counts of the KG statistics (-ks) within this memory budget (in MB) by spilling them to disk.', type=int, required=False)
+    parser.add_argument('-ki', '--kg_index', help='Write the SQLite lookup index of the KG (see kg_index.py) into this file, in the same pass as the KG.', required=False)
+    arg = parser.parse_args()
+    if arg.prune and arg.shared_resources is not None:
+        parser.error('The shared resources (-sr) cannot be pruned (-pr).')
+    if (arg.table_stats is not None or arg.kg_stats is not None or arg.kg_index is not None) and (arg.resume or arg.incremental):
+        parser.error('The statistics and the index cannot be gathered when resuming (-r) or in incremental builds (-inc).')
+    if arg.pipeline and arg.pipeline_workers > 1 and arg.profile_every > 0:
+        parser.error('The tables cannot be profiled (-pe) with more than one pipeline worker (-pw).')
+    if arg.stratify is not None and not arg.random_sample:
+        parser.error('Only the random sample (-rs) can be stratified (-ss).')
+    if arg.random_sample and (arg.workers > 1 or arg.pipeline or arg.resume or arg.incremental):
+        parser.error('The random sample (-rs) cannot be combined with -w, -p, -r or -inc.')
+    return arg
+
+
+'''
+    The shared KG resources already contain the ancestor closure, hence, only if they are not given the taxonomy closure
+    is computed. With prune_args (see get_prune_args), the resources are pruned to the entities of the tables.
+'''
+
 
+def load_kg_resources(taxonomy_path, ecats_path, shared_resources=None, prune_args=None):
+    if prune_args is not None:
+        with metrics.stage('prune_resources'):
+            tax, ecats = pruning.load_pruned_resources(tax_path=taxonomy_path, ec_path=ecats_path, **prune_args)
+        with metrics.stage('taxonomy_closure'):
+            tax_index = du.get_tax_index(tax)
+        print('Loaded the pruned resources with {:d} categories ({:d} closure entries) and {:d} entities.'.format(len(tax), len(tax_index.anc_values), len(ecats)))
+        return tax, ecats
+
+    if shared_resources is not None:
+        with metrics.stage('load_shared_resources'):
+            tax, ecats, sources = du.load_shared_resources(shared_resources)
+        if sources.get('taxonomy') != os.path.abspath(taxonomy_path) or sources.get('entity_cat') != os.path.abspath(ecats_path):
+            print('WARNING: The shared resources {} were built from {}.'.format(shared_resources, sources))
+        print('Loaded the shared resources with {:d} categories and {:d} entities.'.format(len(tax), len(ecats)))
+        return tax, ecats
 
-def load_data(tables_file, taxonomy_path, ecats_path, limit, start=0):
     # load the flat taxonomy
-    tax = du.load_flat_cat_tax(taxonomy_path)
+    with metrics.stage('load_taxonomy'):
+        tax = du.load_flat_cat_tax(taxonomy_path)
     print('Loaded the taxonomy data with {:d} instances.'.format(len(tax)))
 
+    # precompute the ancestor closure of the taxonomy used for the column typing
+    with metrics.stage('taxonomy_closure'):
+        tax_index = du.get_tax_index(tax)
+    print('Computed the taxonomy ancestor closure with {:d} entries.'.format(len(tax_index.anc_values)))
+
     # load the entity category associations
-    ecats = du.load_entity_cats(ecats_path)
+    with metrics.stage('load_entity_cats'):
+        ecats = du.load_entity_cats(ecats_path)
     print('Loaded the entity category data with {:d} instances.'.format(len(ecats)))
+    return tax, ecats
+
 
-    tables = du.load_tables(tables_file, start=start, limit=limit, random_sample=True, tax=tax, ecats=ecats)
+def load_data(tables_file, taxonomy_path, ecats_path, limit, start=0, shared_resources=None, prune_args=None, sample_args=None):
+    tax, ecats = load_kg_resources(taxonomy_path, ecats_path, shared_resources, prune_args)
+
+    tables = du.load_tables(tables_file, start=start, limit=limit, tax=tax, ecats=ecats, **(sample_args or {}))
     print('Loaded {:d} tables.'.format(len(tables)))
 
     return tables
 
 
+'''
+    Same as load_data, however, the tables are returned as a generator, such that they are parsed, typed and written one at a time.
+'''
+
+
+def stream_data(tables_file, taxonomy_path, ecats_path, limit, start=0, shared_resources=None, prune_args=None, sample_args=None):
+    tax, ecats = load_kg_resources(taxonomy_path, ecats_path, shared_resources, prune_args)
+    return du.iter_tables(tables_file, start=start, limit=limit, tax=tax, ecats=ecats, **(sample_args or {}))
+
+
+'''
+    Split the range of tables [start, start + limit) into contiguous shards, one for each worker. The shards are
+    disjoint, hence, no table (and no row or cell blank node, which are labelled by the table ID) is written twice.
+'''
+
+
+def get_shards(start, limit, num_shards):
+    # tables with an ordinal lower than start are skipped, where the ordinals start at 1.
+    start = max(start, 1)
+    shard_size = -(-limit // num_shards)
+
+    shards = []
+    for shard in range(num_shards):
+        shard_limit = min(shard_size, limit - shard * shard_size)
+        if shard_limit <= 0:
+            break
+        shards.append((shard, start + shard * shard_size, shard_limit))
+    return shards
+
+
+'''
+    When resuming, the tables that have been written before the last checkpoint of the output (with the given suffix)
+    are skipped. Returns None if the output has already been completed.
+'''
+
+
+def get_resume_range(out_dir, suffix, start, limit):
+    checkpoint = load_checkpoint(out_dir, suffix)
+    if checkpoint is None:
+        return start, limit
+    if checkpoint['finished']:
+        print('The output {} has already been completed.'.format(suffix))
+        return None
+
+    print('Resuming the output {} after {:d} tables.'.format(suffix, checkpoint['num_tables']))
+    return max(start, 1) + checkpoint['num_tables'], limit - checkpoint['num_tables']
+
+
+'''
+    The taxonomy and entity categories are loaded once in the parent process and written into the shared KG resources,
+    which the worker processes memory-map read-only (see data_prep.shared_store).
+'''
+
+worker_data = {}
+
+
+def init_worker(resources_path, metrics_report=None, lca_options=None, memory_budget=None, metrics_options=None):
+    du.set_lca_options(**({} if lca_options is None else lca_options))
+    worker_data['tax'], worker_data['ecats'], _ = du.load_shared_resources(resources_path)
+    worker_data['metrics_report'] = metrics_report
+    worker_data['metrics_options'] = metrics_options
+    worker_data['memory_budget'] = memory_budget
+
+
+'''
+    Returns the shard along with the partial aggregated KG statistics (if gathered), which are merged in the parent
+    process. The per-table statistics and the partial index are written into the sink paths of the shard, and the exact
+    counts of the partial KG statistics are spilled there (with a memory budget).
+'''
+
+
+def write_shard(tables_file, out_dir, suffix, shard, start, limit, mapper_args, pipeline_args=None, sink_paths=(None, None, None)):
+    if mapper_args.get('resume'):
+        resume_range = get_resume_range(out_dir, '{}_{:d}'.format(suffix, shard), start, limit)
+        if resume_range is None:
+            return shard, None
+        start, limit = resume_range
+
+    # every shard has its own metrics, which are enabled explicitly, since the workers only inherit the state of the
+    # parent process with fork
+    if worker_data['metrics_options'] is not None:
+        metrics.restart(**worker_data['metrics_options'])
+    sinks = get_sinks(*sink_paths, memory_budget=worker_data['memory_budget'], partial=True)
+    if pipeline_args is not None:
+        tbl_mapper = Tbl2KgMapper(tables=None, out_dir=out_dir, suffix='{}_{:d}'.format(suffix, shard), sinks=sinks, **mapper_args)
+        TablePipeline(tables_file, tbl_mapper, start=start, limit=limit, tax=worker_data['tax'], ecats=worker_data['ecats'], **pipeline_args).run()
+    else:
+        tables = du.iter_tables(tables_file, start=start, limit=limit, tax=worker_data['tax'], ecats=worker_data['ecats'])
+        tbl_mapper = Tbl2KgMapper(tables=tables, out_dir=out_dir, suffix='{}_{:d}'.format(suffix, shard), sinks=sinks, **mapper_args)
+        tbl_mapper.write_tables()
+    if worker_data['metrics_report'] is not None:
+        metrics.write_report('{}.shard{:d}'.format(worker_data['metrics_report'], shard))
+    return shard, next((sink.kg_stats for sink in sinks if isinstance(sink, KGStatsSink)), None)
+
+
+def write_shard_job(job):
+    return write_shard(*job)
+
+
+'''
+    The sinks that gather the table statistics, the KG statistics and the KG index along with the KG, if their paths are given.
+'''
+
+
+def get_sinks(table_stats_dir, kg_stats_dir, kg_index_path=None, memory_budget=None, partial=False):
+    sinks = []
+    if table_stats_dir is not None:
+        sinks.append(TableStatsSink(os.path.join(table_stats_dir, 'table_stats.tsv')))
+    if kg_stats_dir is not None:
+        sinks.append(KGStatsSink(kg_stats_dir, memory_budget=memory_budget, partial=partial))
+    if kg_index_path is not None:
+        sinks.append(KGIndexWriter(kg_index_path, partial=partial))
+    return sinks
+
+
+def get_mapper_args(arg):
+    max_file_size = None if arg.max_file_size is None else arg.max_file_size * 1024 * 1024
+    return {'compression': arg.compression, 'max_file_size': max_file_size, 'output_format': arg.output_format,
+            'checkpoint_interval': arg.checkpoint_interval, 'resume': arg.resume}
+
+
+def get_lca_options(arg):
+    return {'max_entities': arg.lca_max_entities, 'patience': arg.lca_patience}
+
+
+def get_metrics_options(arg):
+    if arg.metrics_report is None:
+        return None
+    return {'num_slow_tables': arg.slow_tables, 'profile_every': arg.profile_every}
+
+
+def get_pipeline_args(arg):
+    if not arg.pipeline:
+        return None
+    return {'num_workers': arg.pipeline_workers, 'queue_size': arg.queue_size}
+
+
+'''
+    The random sample is drawn from all the tables from the start offset on, hence, their entities are collected.
+'''
+
+
+def get_prune_args(arg, start, limit):
+    if not arg.prune:
+        return None
+    return {'tables_file': arg.tables, 'start': start, 'limit': None if arg.random_sample else limit, 'cache_dir': arg.prune_cache}
+
+
+def get_sample_args(arg):
+    return {'random_sample': arg.random_sample, 'stratify': arg.stratify, 'seed': arg.seed}
+
+
+def get_resource_sources(arg):
+    return {'taxonomy': os.path.abspath(arg.taxonomy), 'entity_cat': os.path.abspath(arg.entity_cat)}
+
+
+def write_shards(arg):
+    resources_path = arg.shared_resources
+    if resources_path is None:
+        tax, ecats = load_kg_resources(arg.taxonomy, arg.entity_cat, prune_args=get_prune_args(arg, arg.start_offset, arg.data_limit))
+        resources_path = shared_store.create_resources(tax, ecats, du.get_tax_index(tax), sources=get_resource_sources(arg))
+        print('Wrote the shared resources {} for the workers.'.format(resources_path))
+
+    # the statistics of each shard are written into its own directory and appended to the output in the shard order
+    shards = get_shards(arg.start_offset, arg.data_limit, arg.workers)
+    tmp_dir = None if arg.table_stats is None and arg.kg_stats is None and arg.kg_index is None else tempfile.mkdtemp(prefix='sinks_', dir=arg.out_dir)
+    part_dirs = [] if tmp_dir is None else [os.path.join(tmp_dir, str(shard)) for shard, _, _ in shards]
+    for part_dir in part_dirs:
+        os.mkdir(part_dir)
+    kg_stats = None if arg.kg_stats is None else KGStats(arg.kg_stats, memory_budget=get_memory_budget(arg))
+
+    jobs = []
+    for idx, (shard, start, limit) in enumerate(shards):
+        sink_paths = (None, None, None) if tmp_dir is None else (part_dirs[idx] if arg.table_stats else None, part_dirs[idx] if arg.kg_stats else None,
+                                                                 os.path.join(part_dirs[idx], 'kg_index.sqlite') if arg.kg_index else None)
+        jobs.append((arg.tables, arg.out_dir, arg.file_suffix, shard, start, limit, get_mapper_args(arg), get_pipeline_args(arg), sink_paths))
+    try:
+        with Pool(processes=len(jobs), initializer=init_worker, initargs=(resources_path, arg.metrics_report, get_lca_options(arg), get_memory_budget(arg), get_metrics_options(arg))) as pool:
+            for shard, partial in pool.imap(write_shard_job, jobs):
+                print('Finished writing shard {:d}.'.format(shard))
+                if partial is not None:
+                    kg_stats.merge(partial)
+
+        if arg.table_stats is not None:
+            concat_part_files(part_dirs, arg.table_stats, ['table_stats.tsv'])
+        if kg_stats is not None:
+            concat_part_files(part_dirs, arg.kg_stats, PER_TABLE_FILES)
+            kg_stats.close()
+        if arg.kg_index is not None:
+            index_writer = KGIndexWriter(arg.kg_index)
+            for part_dir in part_dirs:
+                index_writer.merge(os.path.join(part_dir, 'kg_index.sqlite'))
+            index_writer.close()
+    finally:
+        if arg.shared_resources is None:
+            os.remove(resources_path)
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+
+'''
+    Write the new and changed tables into the shard of the file suffix, along with the delete set of the changed and
+    removed tables, and update the manifest.
+'''
+
+
+def write_incremental(arg):
+    tax, ecats = load_kg_resources(arg.taxonomy, arg.entity_cat, arg.shared_resources, get_prune_args(arg, arg.start_offset, arg.data_limit))
+    resource_version = incremental.get_resource_version(arg.taxonomy, arg.entity_cat)
+
+    build = incremental.IncrementalBuild(arg.tables, arg.out_dir, arg.file_suffix, resource_version, start=arg.start_offset, limit=arg.data_limit, tax=tax, ecats=ecats)
+    mapper_args = get_mapper_args(arg)
+    mapper_args['resume'] = False
+    tbl_mapper = Tbl2KgMapper(tables=build.iter_tables(), out_dir=arg.out_dir, suffix=arg.file_suffix, **mapper_args)
+    tbl_mapper.write_tables()
+    build.finish()
+
+
 if __name__ == '__main__':
     arg = get_arguments()
+    du.set_lca_options(**get_lca_options(arg))
+    if arg.metrics_report is not None:
+        metrics.enable(**get_metrics_options(arg))
 
-    tables = load_data(tables_file=arg.tables, taxonomy_path=arg.taxonomy, ecats_path=arg.entity_cat, start=arg.start_offset, limit=arg.data_limit)
-    tbl_mapper = Tbl2KgMapper(tables=tables, out_dir=arg.out_dir, suffix=arg.file_suffix)
-    tbl_mapper.write_tables()
+    if arg.incremental:
+        write_incremental(arg)
+    elif arg.workers > 1:
+        write_shards(arg)
+    else:
+        resume_range = get_resume_range(arg.out_dir, arg.file_suffix, arg.start_offset, arg.data_limit) if arg.resume else (arg.start_offset, arg.data_limit)
+        if resume_range is not None and arg.pipeline:
+            tax, ecats = load_kg_resources(arg.taxonomy, arg.entity_cat, arg.shared_resources, get_prune_args(arg, *resume_range))
+            tbl_mapper = Tbl2KgMapper(tables=None, out_dir=arg.out_dir, suffix=arg.file_suffix, sinks=get_sinks(arg.table_stats, arg.kg_stats, arg.kg_index, get_memory_budget(arg)), **get_mapper_args(arg))
+            TablePipeline(arg.tables, tbl_mapper, start=resume_range[0], limit=resume_range[1], tax=tax, ecats=ecats, **get_pipeline_args(arg)).run()
+        elif resume_range is not None:
+            load_fn = load_data if arg.in_memory else stream_data
+            tables = load_fn(tables_file=arg.tables, taxonomy_path=arg.taxonomy, ecats_path=arg.entity_cat, start=resume_range[0], limit=resume_range[1],
+                             shared_resources=arg.shared_resources, prune_args=get_prune_args(arg, *resume_range), sample_args=get_sample_args(arg))
+            tbl_mapper = Tbl2KgMapper(tables=tables, out_dir=arg.out_dir, suffix=arg.file_suffix, sinks=get_sinks(arg.table_stats, arg.kg_stats, arg.kg_index, get_memory_budget(arg)), **get_mapper_args(arg))
+            tbl_mapper.write_tables()
+
+    if arg.metrics_report is not None:
+        metrics.write_report(arg.metrics_report)
@@ -0,0 +1,192 @@
+'''
+    Incremental rebuilds of the knowledge graph. Every table is fingerprinted by its input JSON (along with its entity and
+    section) and the version of the taxonomy and entity categories it has been typed with. The manifest in the output
+    directory keeps for every table ID its fingerprint and the output shard (file suffix) that contains its triples.
+
+    An incremental run only maps the new and changed tables into a delta shard, and writes a delete set with the tables
+    whose triples have to be removed from the older shards, i.e. the changed and the removed tables.
+'''
+
+import argparse
+import hashlib
+import json
+import os
+
+import data_utils as du
+from data_prep.table import Table
+from kg_stats import open_kg_file, split_triple
+
+MANIFEST_FILE = 'manifest.tsv'
+
+
+def get_manifest_path(out_dir):
+    return out_dir + '/' + MANIFEST_FILE
+
+
+def get_delete_set_path(out_dir, suffix):
+    return out_dir + '/wikitbls_kg_' + suffix + '.deleted.tsv'
+
+
+'''
+    The version of the taxonomy and entity categories, which is part of every table fingerprint, such that all tables are
+    re-typed if any of them changes.
+'''
+
+
+def get_resource_version(*paths, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as fin:
+            for chunk in iter(lambda: fin.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_table(table, entity_label, section_label, resource_version):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(resource_version.encode('utf-8'))
+    digest.update(json.dumps([entity_label, section_label, table], sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+'''
+    The manifest is a TSV file of table ID, fingerprint and shard.
+'''
+
+
+def load_manifest(out_dir):
+    manifest = {}
+    path = get_manifest_path(out_dir)
+    if not os.path.isfile(path):
+        return manifest
+
+    with open(path, 'rt', encoding='utf_8') as fin:
+        for line in fin:
+            table_id, fingerprint, shard = line.rstrip('\n').split('\t')
+            manifest[table_id] = (fingerprint, shard)
+    return manifest
+
+
+def write_manifest(out_dir, manifest):
+    path = get_manifest_path(out_dir)
+    with open(path + '.tmp', 'wt', encoding='utf_8') as fout:
+        fout.write(''.join('{}\t{}\t{}\n'.format(table_id, fingerprint, shard) for table_id, (fingerprint, shard) in manifest.items()))
+    os.replace(path + '.tmp', path)
+
+
+class IncrementalBuild:
+    def __init__(self, tables_file, out_dir, suffix, resource_version, start=0, limit=None, tax=None, ecats=None):
+        self.tables_file = tables_file
+        self.out_dir = out_dir
+        self.suffix = suffix
+        self.resource_version = resource_version
+        self.start = start
+        self.limit = limit
+        self.tax = tax
+        self.ecats = ecats
+
+        self.manifest = load_manifest(out_dir)
+        self.seen = set()
+        self.num_scanned = 0
+        self.num_new = 0
+
+        # the tables whose triples have to be removed, along with the shard that contains them
+        self.changed = []
+        self.removed = []
+
+    '''
+        Iterate over the input tables, and only parse, type and return the new and changed tables.
+    '''
+
+    def iter_tables(self):
+        print('Loading changed tables from file {} into shard {}'.format(self.tables_file, self.suffix))
+        for table, entity_label, section_label in du.iter_table_json(self.tables_file, start=self.start, limit=self.limit):
+            self.num_scanned += 1
+            table_id = str(table['id'])
+            self.seen.add(table_id)
+
+            fingerprint = fingerprint_table(table, entity_label, section_label, self.resource_version)
+            previous = self.manifest.get(table_id)
+            if previous is not None and previous[0] == fingerprint:
+                continue
+
+            if previous is None:
+                self.num_new += 1
+            else:
+                self.changed.append((table_id, previous[1]))
+            self.manifest[table_id] = (fingerprint, self.suffix)
+
+            tbl_obj = Table(flat_taxonomy=self.tax, ecats=self.ecats)
+            tbl_obj.load_json(table, entity_label, section_label)
+            yield tbl_obj
+
+    '''
+        Write the delete set and the updated manifest. Tables are only considered as removed if we have scanned the whole
+        input, otherwise the tables beyond the limit would be removed.
+    '''
+
+    def finish(self):
+        if self.start <= 1 and (self.limit is None or self.num_scanned < self.limit):
+            self.removed = [(table_id, shard) for table_id, (_, shard) in self.manifest.items() if table_id not in self.seen]
+            for table_id, _ in self.removed:
+                del self.manifest[table_id]
+        else:
+            print('Only a part of the input has been scanned, hence, no tables are marked as removed.')
+
+        with open(get_delete_set_path(self.out_dir, self.suffix), 'wt', encoding='utf_8') as fout:
+            fout.write(''.join('{}\t{}\tchanged\n'.format(table_id, shard) for table_id, shard in self.changed))
+            fout.write(''.join('{}\t{}\tremoved\n'.format(table_id, shard) for table_id, shard in self.removed))
+
+        write_manifest(self.out_dir, self.manifest)
+        print('Scanned {:d} tables: {:d} new, {:d} changed and {:d} removed.'.format(self.num_scanned, self.num_new, len(self.changed), len(self.removed)))
+
+
+'''
+    The ID of the table a subject belongs to, i.e. <...TableNet#<table ID>>, <...TableNet#<table ID>_<level>_<column>>,
+    _:r<table ID>_<row> or _:c<table ID>_<cell>.
+'''
+
+
+def get_table_id(subject):
+    if subject.startswith('_:'):
+        return subject[3:subject.index('_', 3)]
+    return subject[subject.rfind('#') + 1:-1].split('_', 1)[0]
+
+
+def load_delete_set(delete_set_file):
+    with open(delete_set_file, 'rt', encoding='utf_8') as fin:
+        return set(line.split('\t', 1)[0] for line in fin if line.strip())
+
+
+'''
+    Remove the triples of the deleted tables from an (older) N-Triples shard.
+'''
+
+
+def apply_delete_set(in_file, delete_set, out_file):
+    num_removed = 0
+    with open_kg_file(in_file) as fin, open(out_file, 'wt', encoding='utf_8') as fout:
+        out = []
+        for line in fin:
+            if line.strip() and line[0] != '#' and get_table_id(split_triple(line)[0]) in delete_set:
+                num_removed += 1
+                continue
+            out.append(line)
+            if len(out) >= 100000:
+                fout.write(''.join(out))
+                out.clear()
+        fout.write(''.join(out))
+    print('Removed {:d} triples of {:d} deleted tables.'.format(num_removed, len(delete_set)))
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Use this script to remove the triples of deleted tables from a WikiTablesKG shard.')
+    parser.add_argument('-i', '--input_kg_file', help='The N-Triples shard.', required=True)
+    parser.add_argument('-d', '--delete_set', help='The delete set written by an incremental run of extract_graph.py.', required=True)
+    parser.add_argument('-o', '--out_file', help='The N-Triples output file without the deleted tables.', required=True)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arg = get_arguments()
+    apply_delete_set(arg.input_kg_file, load_delete_set(arg.delete_set), arg.out_file)
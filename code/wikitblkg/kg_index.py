@@ -0,0 +1,296 @@
+'''
+    A local SQLite lookup index over the WikiTablesKG, which answers the following queries without scanning the KG:
+        entity      the cells (table, column, row) that refer to an entity
+        category    the columns that are typed with a category
+        table       the metadata of a table (entity, section, caption, number of rows and columns)
+
+    The index is either built while the KG is written (see extract_graph.py -ki, where it is one of the sinks) or from
+    the N-Triples files afterwards. The entities and categories are stored in the form of the KG, i.e. with '_' for
+    spaces and '' for ", and the queries are normalized in the same way. The entity and section of a table are stored
+    in the form of its document IRI (only with '_' for spaces), whereas the captions and column names are stored
+    unescaped.
+'''
+
+import argparse
+import os
+import sqlite3
+import time
+from urllib.parse import unquote_plus
+
+from kg_stats import NUMBER_OF_COLUMNS, NUMBER_OF_ROWS, PART_OF_COLUMN, RDF_TYPE, SUBJECT, TABLE_CLASS, TN_SCHEMA, get_kg_files, \
+    iter_triples, strip_literal
+from nt_encoding import normalize_name, unescape_literal
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Use this script to build and query the lookup index of the WikiTablesKG.')
+    parser.add_argument('-x', '--index', help='The path of the SQLite index.', required=True)
+    parser.add_argument('-i', '--input_kg_files', help='Build the index from the KG files (a single N-Triples file or a directory).', required=False)
+    parser.add_argument('-e', '--entity', help='Return the cells (table, column, row) that refer to this entity.', required=False)
+    parser.add_argument('-c', '--category', help='Return the columns that are typed with this category.', required=False)
+    parser.add_argument('-t', '--table', help='Return the metadata of this table ID.', type=int, required=False)
+    parser.add_argument('-l', '--limit', help='The maximum number of results.', type=int, default=100)
+    return parser.parse_args()
+
+
+HAS_TABLE_ID = '<' + TN_SCHEMA + 'hasTableID>'
+HAS_CAPTION = '<' + TN_SCHEMA + 'hasCaption>'
+DOCUMENT = '<' + TN_SCHEMA + 'document>'
+COLUMN_POSITION = '<' + TN_SCHEMA + 'columnPosition>'
+COLUMN_NAME = '<' + TN_SCHEMA + 'columnName>'
+HAS_LEVEL = '<' + TN_SCHEMA + 'hasLevel>'
+REFERS_TO = '<' + TN_SCHEMA + 'refersTo>'
+HAS_CELL = '<' + TN_SCHEMA + 'hasCell>'
+
+SCHEMA = ['CREATE TABLE tables (table_id INTEGER PRIMARY KEY, entity TEXT, section TEXT, caption TEXT, num_rows INTEGER, num_cols INTEGER)',
+          'CREATE TABLE columns (table_id INTEGER, col_idx INTEGER, name TEXT, category TEXT)',
+          'CREATE TABLE cells (entity TEXT, table_id INTEGER, col_idx INTEGER, row_idx INTEGER)']
+
+# the indexes are only created once all the rows have been inserted, which is much faster than maintaining them
+INDEXES = ['CREATE INDEX columns_table ON columns (table_id, col_idx)',
+           'CREATE INDEX columns_category ON columns (category)',
+           'CREATE INDEX cells_entity ON cells (entity)']
+
+
+def get_iri_name(iri):
+    return unquote_plus(iri[max(iri.rfind('/'), iri.rfind('#')) + 1:-1])
+
+
+'''
+    Write the index. The rows are inserted in batches into a temporary database, which is moved to the path on close.
+    With partial=True, the indexes are not created, e.g. for the index of a shard that is merged into another one.
+
+    A table ID is only indexed once. Later tables with the same ID (e.g. from the KG files of repeated or overlapping
+    runs) are skipped and reported.
+'''
+
+
+class KGIndexWriter:
+    def __init__(self, path, batch_size=100000, partial=False):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.batch_size = batch_size
+        self.partial = partial
+        self.num_tables = 0
+        self.table_ids = set()
+        self.num_duplicates = 0
+        self.duplicate_ids = []
+
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.conn = sqlite3.connect(self.tmp_path)
+        self.conn.execute('PRAGMA journal_mode = OFF')
+        self.conn.execute('PRAGMA synchronous = OFF')
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+
+        self.tables = []
+        self.columns = []
+        self.cells = []
+
+    '''
+        Add a table while it is written into the KG, i.e. the interface of the sinks (see sinks.py).
+    '''
+
+    def add_table(self, table, data):
+        table_id = table.table_id
+        if self.__is_duplicate(table_id):
+            return
+        section = '' if table.section == 'MAIN_SECTION' else table.section
+        self.tables.append((table_id, table.entity.replace(' ', '_'), section.replace(' ', '_'), table.table_caption,
+                            len(table.table_rows), table.num_cols))
+
+        # only the columns of the last level are typed
+        for col_idx, column in enumerate(table.columns[-1]):
+            self.columns.append((table_id, col_idx, column, normalize_name(table.column_types[column])))
+
+        for row_idx, row in enumerate(table.table_rows):
+            for col_idx, cell in enumerate(row):
+                if cell is None or cell[0] != 'STRUCT':
+                    continue
+                for val_ in cell[1]:
+                    if len(val_):
+                        self.cells.append((normalize_name(val_), table_id, col_idx, row_idx))
+        self.__end_table()
+
+    '''
+        Add the tables of an N-Triples file, whose triples are grouped by table (as written by Tbl2KgMapper).
+    '''
+
+    def add_kg_file(self, in_file):
+        triples = []
+        for s, p, o in iter_triples(in_file):
+            if p == RDF_TYPE and o == TABLE_CLASS and triples:
+                self.__add_table_triples(triples)
+                triples = []
+            triples.append((s, p, o))
+        if triples:
+            self.__add_table_triples(triples)
+
+    def __add_table_triples(self, triples):
+        table = {'caption': '', 'entity': '', 'section': ''}
+        col_positions = {}
+        col_names = {}
+        col_levels = {}
+        col_types = {}
+        cell_entities = {}
+        cell_columns = {}
+        cell_rows = {}
+
+        for s, p, o in triples:
+            if p == HAS_TABLE_ID:
+                table['table_id'] = int(o)
+            elif p == NUMBER_OF_ROWS:
+                table['num_rows'] = int(o)
+            elif p == NUMBER_OF_COLUMNS:
+                table['num_cols'] = int(o)
+            elif p == HAS_CAPTION:
+                table['caption'] = unescape_literal(strip_literal(o))
+            elif p == DOCUMENT:
+                table['entity'], _, table['section'] = get_iri_name(o).partition('#')
+            elif p == COLUMN_POSITION:
+                col_positions.setdefault(s, []).append(int(o))
+            elif p == COLUMN_NAME:
+                col_names[s] = unescape_literal(strip_literal(o))
+            elif p == HAS_LEVEL:
+                col_levels[s] = int(o)
+            elif p == SUBJECT:
+                col_types[s] = unquote_plus(strip_literal(o))
+            elif p == REFERS_TO:
+                cell_entities.setdefault(s, []).append(get_iri_name(o))
+            elif p == PART_OF_COLUMN:
+                cell_columns[s] = o
+            elif p == HAS_CELL:
+                cell_rows[o] = int(s[s.rfind('_') + 1:])
+
+        table_id = table['table_id']
+        if self.__is_duplicate(table_id):
+            return
+        self.tables.append((table_id, table['entity'], table['section'], table['caption'], table['num_rows'], table['num_cols']))
+
+        # columns with the same name share their IRI, and their cells are assigned to the first of these columns
+        last_level = max(col_levels.values(), default=0)
+        for col_uri, positions in col_positions.items():
+            if col_levels.get(col_uri) == last_level:
+                for col_idx in positions:
+                    self.columns.append((table_id, col_idx, col_names[col_uri], col_types[col_uri]))
+
+        for cell_uri, entities in cell_entities.items():
+            col_idx = min(col_positions[cell_columns[cell_uri]])
+            for entity in entities:
+                self.cells.append((entity, table_id, col_idx, cell_rows[cell_uri]))
+        self.__end_table()
+
+    def __is_duplicate(self, table_id):
+        if table_id in self.table_ids:
+            self.num_duplicates += 1
+            if len(self.duplicate_ids) < 10:
+                self.duplicate_ids.append(table_id)
+            return True
+        self.table_ids.add(table_id)
+        return False
+
+    def __end_table(self):
+        self.num_tables += 1
+        if len(self.tables) + len(self.columns) + len(self.cells) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.conn.executemany('INSERT INTO tables VALUES (?, ?, ?, ?, ?, ?)', self.tables)
+        self.conn.executemany('INSERT INTO columns VALUES (?, ?, ?, ?)', self.columns)
+        self.conn.executemany('INSERT INTO cells VALUES (?, ?, ?, ?)', self.cells)
+        self.conn.commit()
+        self.tables.clear()
+        self.columns.clear()
+        self.cells.clear()
+
+    '''
+        Merge the (partial) index of another shard, in the order of the merged indexes.
+    '''
+
+    def merge(self, path):
+        self.flush()
+        self.conn.execute('ATTACH DATABASE ? AS other', (path,))
+        self.conn.execute('CREATE TEMP TABLE duplicates (table_id INTEGER PRIMARY KEY)')
+        for (table_id,) in self.conn.execute('SELECT table_id FROM other.tables').fetchall():
+            if self.__is_duplicate(table_id):
+                self.conn.execute('INSERT OR IGNORE INTO duplicates VALUES (?)', (table_id,))
+        for name in ('tables', 'columns', 'cells'):
+            self.conn.execute('INSERT INTO {0} SELECT * FROM other.{0} WHERE table_id NOT IN (SELECT table_id FROM temp.duplicates)'.format(name))
+        self.conn.commit()
+        self.conn.execute('DROP TABLE temp.duplicates')
+        self.conn.execute('DETACH DATABASE other')
+
+    def close(self):
+        self.flush()
+        if self.num_duplicates:
+            print('WARNING: Skipped {:d} tables whose ID has already been indexed, e.g. {}.'.format(
+                self.num_duplicates, ', '.join(str(table_id) for table_id in self.duplicate_ids)))
+        if not self.partial:
+            for statement in INDEXES:
+                self.conn.execute(statement)
+            self.conn.execute('ANALYZE')
+        self.conn.commit()
+        self.conn.close()
+        os.replace(self.tmp_path, self.path)
+
+
+'''
+    Read-only queries of the index.
+'''
+
+
+class KGIndex:
+    def __init__(self, path):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        self.conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+
+    def find_entity(self, entity, limit=None):
+        query = ('SELECT cells.table_id, cells.col_idx, columns.name, cells.row_idx FROM cells '
+                 'LEFT JOIN columns ON columns.table_id = cells.table_id AND columns.col_idx = cells.col_idx '
+                 'WHERE cells.entity = ? ORDER BY cells.table_id, cells.row_idx, cells.col_idx')
+        return self.__query(query, normalize_name(entity), limit)
+
+    def find_category(self, category, limit=None):
+        query = 'SELECT table_id, col_idx, name FROM columns WHERE category = ? ORDER BY table_id, col_idx'
+        return self.__query(query, normalize_name(category), limit)
+
+    def get_table(self, table_id):
+        row = self.conn.execute('SELECT * FROM tables WHERE table_id = ?', (table_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['table_id', 'entity', 'section', 'caption', 'num_rows', 'num_cols'], row))
+
+    def __query(self, query, term, limit):
+        if limit is not None:
+            return self.conn.execute(query + ' LIMIT ?', (term, limit)).fetchall()
+        return self.conn.execute(query, (term,)).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    arg = get_arguments()
+
+    if arg.input_kg_files is not None:
+        writer = KGIndexWriter(arg.index)
+        for kg_file in get_kg_files(arg.input_kg_files):
+            print('Indexing file {}'.format(kg_file))
+            writer.add_kg_file(kg_file)
+        writer.close()
+        print('Indexed {:d} tables into {}.'.format(writer.num_tables, arg.index))
+
+    index = KGIndex(arg.index)
+    start = time.perf_counter()
+    if arg.entity is not None:
+        for result in index.find_entity(arg.entity, limit=arg.limit):
+            print('\t'.join(str(val) for val in result))
+    if arg.category is not None:
+        for result in index.find_category(arg.category, limit=arg.limit):
+            print('\t'.join(str(val) for val in result))
+    if arg.table is not None:
+        print(index.get_table(arg.table))
+    print('Answered the queries in {:.1f} ms.'.format((time.perf_counter() - start) * 1000))
+    index.close()
@@ -1,217 +1,488 @@
 import argparse
+import bz2
 import gzip
+import lzma
 import os
-from collections import defaultdict
+import shutil
+import tempfile
+from collections import Counter, defaultdict
+from multiprocessing import Pool
 from os.path import isfile, join
 
+import sketches
+from spill_counter import SpillingCounter
+
 
 def get_arguments():
     parser = argparse.ArgumentParser(description='Use this script to construct the WikiTablesKG from the TableNet tables.')
     parser.add_argument('-i', '--input_kg_files', help='The input knowledge graph files.', required=True)
     parser.add_argument('-o', '--out_dir', help='The output directory for storing the stats embeddings.', required=True)
     parser.add_argument('-f', '--stats_flag', help='Determine the type of statistics we want to extract', required=True, default='a')
+    parser.add_argument('-w', '--workers', help='The number of worker processes, each processing one KG file at a time.', type=int, default=1)
+    parser.add_argument('-a', '--approx', help='Approximate the cell value and column co-occurrences with sketches instead of exact counts.', action='store_true')
+    parser.add_argument('-eps', '--eps', help='The error of the approximate counts, as a fraction of the number of cells.', type=float, default=0.0001)
+    parser.add_argument('-delta', '--delta', help='The probability that an approximate count exceeds the error bound.', type=float, default=0.01)
+    parser.add_argument('-hh', '--heavy_hitters', help='The number of most frequent cell value and column pairs we keep track of.', type=int, default=10000)
+    parser.add_argument('-de', '--distinct_error', help='The relative error of the distinct counts.', type=float, default=0.01)
+    parser.add_argument('-mb', '--memory_budget', help='Keep the exact cell value and column counts within this memory budget (in MB) by spilling them to disk.', type=int, required=False)
+    parser.add_argument('-ms', '--merge_sketches', help='Comma separated sketch files of previous runs (e.g. of other shards), which are merged into the output.', required=False)
     return parser.parse_args()
 
+
 '''
-    Extract the number of triples per table.
+    The predicates and objects of the N-Triples written by Tbl2KgMapper that we need for the statistics.
 '''
-def __num_triples_per_table(in_file, out_dir, skip_lines=7):
-    fin = gzip.open(in_file, 'rt', encoding='utf_8')
 
-    table_data = {}
-    buffer_ = []
-    table_id = None
-    for line_idx, line in enumerate(fin):
-        if line_idx < skip_lines:
-            continue
+TN_SCHEMA = 'https://www.tablenet.l3s.uni-hannover.de/TableNet#'
 
-        if 'a tn:Table' in line:
-            tmp_tbl_id = line.strip().split(' ')[0]
-            if table_id is not None:
-                table_data[table_id] = len(buffer_)
-                buffer_.clear()
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+TABLE_CLASS = '<' + TN_SCHEMA + 'Table>'
+CELL_CLASS = '<' + TN_SCHEMA + 'Cell>'
 
-                # change the table ID
-                table_id = tmp_tbl_id
-            else:
-                table_id = tmp_tbl_id
-        else:
-            buffer_.append(line.strip().split(' '))
+NUMBER_OF_COLUMNS = '<' + TN_SCHEMA + 'numberOfColumns>'
+NUMBER_OF_ROWS = '<' + TN_SCHEMA + 'numberOfRows>'
+SUBJECT = '<http://purl.org/dc/terms/subject>'
+CELL_VALUE = '<' + TN_SCHEMA + 'cellValue>'
+CELL_TYPE = '<' + TN_SCHEMA + 'cellType>'
+PART_OF_COLUMN = '<' + TN_SCHEMA + 'partOfColumn>'
 
-    table_data[table_id] = len(buffer_)
+KG_FILE_EXTENSIONS = ('.nt', '.nt.gz', '.nt.bz2', '.nt.xz')
 
-    #write the output
-    out_str = ''
-    fout = open(out_dir + '/num_triples_per_table.tsv', 'a', encoding='utf_8')
-    for tbl_id in table_data:
-        out_str += '{}\t{:d}\n'.format(tbl_id, table_data[tbl_id])
 
-        if len(out_str) > 10000:
-            fout.write(out_str)
-            out_str = ''
-    fout.write(out_str)
-    fout.close()
+def open_kg_file(in_file):
+    if in_file.endswith('.gz'):
+        return gzip.open(in_file, 'rt', encoding='utf_8')
+    elif in_file.endswith('.bz2'):
+        return bz2.open(in_file, 'rt', encoding='utf_8')
+    elif in_file.endswith('.xz'):
+        return lzma.open(in_file, 'rt', encoding='utf_8')
+    return open(in_file, 'rt', encoding='utf_8')
 
 
-def __parse_kg_by_table(in_file, out_dir, skip_lines=7):
-    fin = gzip.open(in_file, 'rt', encoding='utf_8')
+'''
+    Split an N-Triples line into its subject, predicate and object. The subject and predicate never contain spaces,
+    whereas the object is everything up to the closing ' .'.
+'''
 
-    table_data = defaultdict(list)
-    buffer_ = []
-    table_id = None
-    count = 0
-    for line_idx, line in enumerate(fin):
-        if line_idx < skip_lines:
+
+def split_triple(line):
+    s, p, o = line.split(' ', 2)
+    return s, p, o.rstrip()[:-2]
+
+
+def strip_literal(term):
+    return term[1:-1] if term.startswith('"') else term
+
+
+'''
+    The column name is the last part of the column IRI <...TableNet#<table ID>_<column level>_<column name>>
+'''
+
+
+def get_column_name(col_uri):
+    col_id = col_uri[col_uri.rfind('#') + 1:-1]
+    parts = col_id.split('_', 2)
+    return parts[-1]
+
+
+'''
+    Iterate over the (subject, predicate, object) triples of N-Triples lines, or of a KG file.
+'''
+
+
+def parse_triples(lines):
+    for line in lines:
+        if not line.strip() or line[0] == '#':
             continue
+        yield split_triple(line)
 
-        if 'a tn:Table' in line:
-            tmp_tbl_id = line.strip().split(' ')[0]
-            if table_id is not None:
-                table_data[table_id].extend(buffer_)
-                buffer_.clear()
 
-                # change the table ID
-                table_id = tmp_tbl_id
+def iter_triples(in_file):
+    with open_kg_file(in_file) as fin:
+        yield from parse_triples(fin)
 
-                # process the table data every 100 tables.
-                if len(table_data) % 10000 == 0:
-                    num_cols, num_rows, num_cells, col_types, cell_types, cell_column = __parse_table_stats(table_data)
-                    __write_stats(out_dir, num_cols, num_rows, num_cells, col_types, cell_types, cell_column)
 
-                    count += 10000
-                    print('Processed {:d} table stats so far...'.format(count))
+'''
+    The approximate cell value and column co-occurrences, which replace the exact counts whose memory grows with the
+    number of distinct cell values. For a value-column pair we track
+        count           a Count-Min sketch, which overestimates a count by at most eps * (number of cells)
+        heavy hitters   the candidates for the most frequent pairs, which are written with their Count-Min estimates
+        distinct        HyperLogLog counts of the distinct cell values and value-column pairs
+'''
+
+
+class CellColumnSketch:
+    def __init__(self, eps=0.0001, delta=0.01, heavy_hitters=10000, distinct_error=0.01):
+        self.counts = sketches.CountMinSketch(eps, delta)
+        self.heavy_hitters = sketches.HeavyHitters(heavy_hitters)
+        self.distinct_values = sketches.HyperLogLog(distinct_error)
+        self.distinct_pairs = sketches.HyperLogLog(distinct_error)
+
+    def get_sketches(self):
+        return {'counts': self.counts, 'heavy_hitters': self.heavy_hitters, 'distinct_values': self.distinct_values, 'distinct_pairs': self.distinct_pairs}
+
+    @staticmethod
+    def load(path):
+        cell_column = CellColumnSketch.__new__(CellColumnSketch)
+        for name, sketch in sketches.read_sketches(path)[0].items():
+            setattr(cell_column, name, sketch)
+        return cell_column
+
+    def add(self, cell_value, column):
+        key = cell_value + '\t' + column
+        h = sketches.hash128(key)
+        self.counts.add_hash(h)
+        self.heavy_hitters.add(key)
+        self.distinct_values.add(cell_value)
+        self.distinct_pairs.add_hash(h)
+
+    def merge(self, other):
+        self.counts.merge(other.counts)
+        self.heavy_hitters.merge(other.heavy_hitters)
+        self.distinct_values.merge(other.distinct_values)
+        self.distinct_pairs.merge(other.distinct_pairs)
+
+    '''
+        Write the heavy hitters in the format of the exact statistics (sorted by their estimated count), the distinct
+        counts and the sketches themselves, such that they can be merged with the sketches of other runs.
+    '''
+
+    def write(self, out_dir):
+        estimates = [(self.counts.estimate(key), key) for key in self.heavy_hitters.keys()]
+        estimates.sort(key=lambda x: (-x[0], x[1]))
+        with open(out_dir + '/cell_column_stats.tsv', 'a', encoding='utf_8') as fout:
+            fout.write(''.join('{}\t{:d}\n'.format(key, count) for count, key in estimates))
+
+        with open(out_dir + '/distinct_stats.tsv', 'w', encoding='utf_8') as fout:
+            fout.write('num_cell_column\t{:d}\n'.format(self.counts.total))
+            fout.write('distinct_cell_values\t{:d}\n'.format(self.distinct_values.count()))
+            fout.write('distinct_cell_column\t{:d}\n'.format(self.distinct_pairs.count()))
+
+        sketches.write_sketches(out_dir + '/cell_column_sketch.snap', self.get_sketches())
 
-                    table_data.clear()
-            else:
-                table_id = tmp_tbl_id
-        else:
-            buffer_.append(line.strip().split(' '))
 
-    # process the table data every 100 tables.
-    num_cols, num_rows, num_cells, col_types, cell_types, cell_column = __parse_table_stats(table_data)
-    __write_stats(out_dir, num_cols, num_rows, num_cells, col_types, cell_types, cell_column)
-    count += 10000
-    print('Processed {:d} table stats so far...'.format(count))
+'''
+    Streaming statistics over the KG. The triples are processed one at a time, where only the counters of the current
+    table are kept. The per-table statistics are written in batches as the tables are processed, whereas the aggregated
+    statistics (cell types and the cell value and column co-occurrences) are written at the end. If sketch_args are
+    given, the cell value and column co-occurrences are approximated with a CellColumnSketch. Otherwise, if a
+    memory_budget (in bytes) is given, the exact co-occurrences are counted with a SpillingCounter.
+'''
 
-    table_data.clear()
+
+class KGStats:
+    def __init__(self, out_dir, buffer_size=10000, sketch_args=None, memory_budget=None):
+        self.out_dir = out_dir
+        self.buffer_size = buffer_size
+        self.sketch = None if sketch_args is None else CellColumnSketch(**sketch_args)
+        self.spill = None if memory_budget is None or self.sketch is not None else SpillingCounter(out_dir, memory_budget)
+        self.num_tables = 0
+
+        # the state of the current table and cell
+        self.table_id = None
+        self.table_cells = 0
+        self.cell_values = []
+
+        # the per-table statistics
+        self.num_cols = []
+        self.num_rows = []
+        self.num_cells = []
+        self.col_types = []
+
+        # the aggregated statistics
+        self.cell_types = Counter()
+        self.cell_column = defaultdict(Counter)
+
+    def add_file(self, in_file):
+        for s, p, o in iter_triples(in_file):
+            self.add_triple(s, p, o)
+        self.end_table()
+
+    '''
+        Add the N-Triples of a single table, e.g. as they are produced by Tbl2KgMapper (see sinks.KGStatsSink).
+    '''
+
+    def add_data(self, data):
+        for s, p, o in parse_triples(data.split('\n')):
+            self.add_triple(s, p, o)
+        self.end_table()
+
+    def add_triple(self, s, p, o):
+        if p == RDF_TYPE:
+            if o == TABLE_CLASS:
+                self.end_table()
+                self.table_id = s
+            elif o == CELL_CLASS:
+                self.table_cells += 1
+        elif p == NUMBER_OF_ROWS:
+            self.num_rows.append(o)
+        elif p == NUMBER_OF_COLUMNS:
+            self.num_cols.append(o)
+        elif p == SUBJECT:
+            self.col_types.append('{}\t{}'.format(s, strip_literal(o)))
+        elif p == CELL_TYPE:
+            self.cell_types[strip_literal(o)] += 1
+
+        # the last two clauses are necessary to store the cell-column value distributions.
+        elif p == CELL_VALUE:
+            self.cell_values.append(o)
+        elif p == PART_OF_COLUMN:
+            column = get_column_name(o)
+            if self.sketch is not None:
+                for cell_value in self.cell_values:
+                    self.sketch.add(cell_value, column)
+            elif self.spill is not None:
+                for cell_value in self.cell_values:
+                    self.spill.add(cell_value + '\t' + column)
+            else:
+                for cell_value in self.cell_values:
+                    self.cell_column[cell_value][column] += 1
+            self.cell_values.clear()
+
+    def end_table(self):
+        if self.table_id is None:
+            return
+
+        self.num_cells.append('{}\t{:d}'.format(self.table_id, self.table_cells))
+        self.table_id = None
+        self.table_cells = 0
+        self.cell_values.clear()
+
+        self.num_tables += 1
+        if len(self.num_cells) >= self.buffer_size:
+            self.flush()
+            print('Processed {:d} table stats so far...'.format(self.num_tables))
+
+    def __append(self, file_name, lines):
+        if len(lines) == 0:
+            return
+        with open(self.out_dir + '/' + file_name, 'a', encoding='utf_8') as fout:
+            fout.write('\n'.join(lines) + '\n')
+
+    '''
+        Write the per-table statistics that we have gathered so far.
+    '''
+
+    def flush(self):
+        self.__append('num_columns_stats.tsv', self.num_cols)
+        self.__append('num_rows_stats.tsv', self.num_rows)
+        self.__append('num_cells_stats.tsv', self.num_cells)
+        self.__append('col_types_stats.tsv', self.col_types)
+
+        self.num_cols.clear()
+        self.num_rows.clear()
+        self.num_cells.clear()
+        self.col_types.clear()
+
+    '''
+        Write the exact counts kept in memory as a run (with a memory budget), such that a partial KGStats that is passed
+        to another process only carries the paths of its runs.
+    '''
+
+    def spill_counts(self):
+        if self.spill is not None:
+            self.spill.spill()
+
+    '''
+        Merge the aggregated statistics of another KGStats instance (e.g. computed for another KG file), whose
+        per-table statistics have already been written.
+    '''
+
+    def merge(self, other):
+        self.num_tables += other.num_tables
+        self.cell_types.update(other.cell_types)
+        if self.sketch is not None:
+            self.sketch.merge(other.sketch)
+        if self.spill is not None:
+            self.spill.merge(other.spill)
+        for cell_value, columns in other.cell_column.items():
+            self.cell_column[cell_value].update(columns)
+
+    '''
+        Write the remaining per-table statistics and the aggregated statistics.
+    '''
+
+    def close(self):
+        self.flush()
+        self.__append('cell_types_stats.tsv', ['{}\t{:d}'.format(cell_type, count) for cell_type, count in self.cell_types.items()])
+
+        if self.sketch is not None:
+            self.sketch.write(self.out_dir)
+            print('Processed {:d} table stats.'.format(self.num_tables))
+            return
+
+        if self.spill is not None:
+            with open(self.out_dir + '/cell_column_stats.tsv', 'a', encoding='utf_8') as fout:
+                out = []
+                for key, count in self.spill.items():
+                    out.append('{}\t{:d}\n'.format(key, count))
+                    if len(out) > self.buffer_size:
+                        fout.write(''.join(out))
+                        out.clear()
+                fout.write(''.join(out))
+            self.spill.close()
+            print('Processed {:d} table stats.'.format(self.num_tables))
+            return
+
+        with open(self.out_dir + '/cell_column_stats.tsv', 'a', encoding='utf_8') as fout:
+            out = []
+            for cell_value, columns in self.cell_column.items():
+                for column, count in columns.items():
+                    out.append('{}\t{}\t{:d}\n'.format(cell_value, column, count))
+                if len(out) > self.buffer_size:
+                    fout.write(''.join(out))
+                    out.clear()
+            fout.write(''.join(out))
+        print('Processed {:d} table stats.'.format(self.num_tables))
 
 
 '''
-    Write the statistics that we have gather for the KG.
+    Extract the number of triples per table.
 '''
 
 
-def __write_stats(out_dir, num_cols, num_rows, num_cells, col_types, cell_types, cell_column):
-    num_cols_str = '\n'.join(map(str, num_cols))
-    num_rows_str = '\n'.join(map(str, num_rows))
-    num_cells_str = '\n'.join('{}\t{:d}'.format(v[0], v[1]) for v in list(num_cells.items()))
+def num_triples_per_table(in_file, out_dir):
+    out = []
+    table_id = None
+    num_triples = 0
+    with open(out_dir + '/num_triples_per_table.tsv', 'a', encoding='utf_8') as fout:
+        for s, p, o in iter_triples(in_file):
+            if p == RDF_TYPE and o == TABLE_CLASS:
+                if table_id is not None:
+                    out.append('{}\t{:d}\n'.format(table_id, num_triples))
+                table_id = s
+                num_triples = 0
+            num_triples += 1
 
-    col_types_str = '\n'.join('{}\t{}'.format(v[0], v[1]) for v in list(col_types.items()))
-    cell_types_str = '\n'.join('{}\t{:d}'.format(v[0], v[1]) for v in list(cell_types.items()))
+            if len(out) > 10000:
+                fout.write(''.join(out))
+                out.clear()
 
-    cell_column_str = ''
-    for cell_ in cell_column:
-        cell_column_str += '\n'.join('{}\t{}\t{}\n'.format(cell_, v[0], v[1]) for v in list(cell_column[cell_].items()))
+        if table_id is not None:
+            out.append('{}\t{:d}\n'.format(table_id, num_triples))
+        fout.write(''.join(out))
 
-    fin = open(out_dir + '/num_columns_stats.tsv', 'a', encoding='utf_8')
-    fin.write(num_cols_str + '\n')
-    fin.close()
 
-    fin = open(out_dir + '/num_rows_stats.tsv', 'a', encoding='utf_8')
-    fin.write(num_rows_str + '\n')
-    fin.close()
+def get_kg_files(input_kg_files):
+    if os.path.isfile(input_kg_files):
+        return [input_kg_files]
+    return sorted(join(input_kg_files, f) for f in os.listdir(input_kg_files)
+                  if isfile(join(input_kg_files, f)) and 'wikitbls_kg_' in f and f.endswith(KG_FILE_EXTENSIONS))
 
-    fin = open(out_dir + '/num_cells_stats.tsv', 'a', encoding='utf_8')
-    fin.write(num_cells_str + '\n')
-    fin.close()
 
-    fin = open(out_dir + '/col_types_stats.tsv', 'a', encoding='utf_8')
-    fin.write(col_types_str + '\n')
-    fin.close()
+PER_TABLE_FILES = ['num_columns_stats.tsv', 'num_rows_stats.tsv', 'num_cells_stats.tsv', 'col_types_stats.tsv', 'num_triples_per_table.tsv']
 
-    fin = open(out_dir + '/cell_types_stats.tsv', 'a', encoding='utf_8')
-    fin.write(cell_types_str + '\n')
-    fin.close()
+'''
+    Append the files that have been written into the part directories to the files of the output directory, in the order
+    of the part directories.
+'''
 
-    fin = open(out_dir + '/cell_column_stats.tsv', 'a', encoding='utf_8')
-    fin.write(cell_column_str + '\n')
-    fin.close()
+
+def concat_part_files(part_dirs, out_dir, file_names):
+    for file_name in file_names:
+        parts = [join(part_dir, file_name) for part_dir in part_dirs if isfile(join(part_dir, file_name))]
+        if len(parts) == 0:
+            continue
+        with open(join(out_dir, file_name), 'ab') as fout:
+            for part in parts:
+                with open(part, 'rb') as fin:
+                    shutil.copyfileobj(fin, fout)
 
 
 '''
-    We gather different statistics for the KG that we have created.
+    Process a single KG file in a worker process. The per-table statistics are written into a temporary directory,
+    whereas the aggregated statistics are returned as a partial KGStats, which is merged with the ones of other files.
 '''
 
 
-def __parse_table_stats(table_data):
-    num_cols = []
-    num_rows = []
-    num_cells = {}
+def gather_file_stats(in_file, part_dir, stats_flag, sketch_args=None, memory_budget=None):
+    print('Parsing file {}'.format(in_file))
+    kg_stats = KGStats(part_dir, sketch_args=sketch_args, memory_budget=memory_budget)
+    if stats_flag == 'a':
+        kg_stats.add_file(in_file)
+        kg_stats.end_table()
+        kg_stats.flush()
+        kg_stats.spill_counts()
+    else:
+        num_triples_per_table(in_file, part_dir)
+    return kg_stats
+
 
-    col_types = {}
-    cell_types = {}
-    cell_column = {}
+def gather_file_stats_job(job):
+    return gather_file_stats(*job)
 
-    for tbl_id in table_data:
-        lines_ = table_data[tbl_id]
-        num_cells[tbl_id] = 0
 
-        cell_value_ = None
-        for line in lines_:
-            if 'tn:numberOfRows' in line:
-                data = int(line[-2])
-                num_rows.append(data)
-            elif 'tn:numberOfColumns' in line:
-                data = int(line[-2])
-                num_cols.append(data)
-            elif 'dct:subject' in line:
-                type = line[-1]
-                type = type[1:len(type) - 2]
-                col_types[line[0]] = type
-            elif 'tn:Cell' in line:
-                num_cells[tbl_id] += 1
-            elif 'tn:cellType' in line:
-                cell_type_ = line[-2]
-                if cell_type_ not in cell_types:
-                    cell_types[cell_type_] = 1
-                else:
-                    cell_types[cell_type_] += 1
+'''
+    Process the KG files in a process pool, and reduce the partial statistics into the output files in the order of the
+    KG files, such that the output is the same as for a single process. The partial statistics are merged one at a time
+    as they arrive, i.e. the parent process does not hold the partial statistics of all the files at once.
+'''
+
 
-            # the last two clauses are necessary to store the cell-column value distributions.
-            elif 'tn:cellValue' in line:
-                cell_value_ = line[-2]
-            elif 'tn:partOfColumn' in line:
-                cell_column_ = line[-2]
-                cell_column_ = cell_column_.split('_')[-1]
+def gather_stats_parallel(kg_files, out_dir, stats_flag, workers, sketch_args=None, merge_sketches=None, memory_budget=None):
+    tmp_dir = tempfile.mkdtemp(prefix='kg_stats_', dir=out_dir)
+    part_dirs = [join(tmp_dir, str(idx)) for idx in range(len(kg_files))]
+    for part_dir in part_dirs:
+        os.mkdir(part_dir)
 
-                # we store here the cell-column distributions
-                if cell_value_ not in cell_column:
-                    cell_column[cell_value_] = {}
-                    cell_column[cell_value_][cell_column_] = 1
-                else:
-                    if cell_column_ not in cell_column[cell_value_]:
-                        cell_column[cell_value_][cell_column_] = 1
-                    else:
-                        cell_column[cell_value_][cell_column_] += 1
+    kg_stats = KGStats(out_dir, sketch_args=sketch_args, memory_budget=memory_budget)
+    try:
+        with Pool(processes=workers) as pool:
+            jobs = [(in_file, part_dir, stats_flag, sketch_args, memory_budget) for in_file, part_dir in zip(kg_files, part_dirs)]
+            for partial in pool.imap(gather_file_stats_job, jobs):
+                kg_stats.merge(partial)
 
-    return num_cols, num_rows, num_cells, col_types, cell_types, cell_column
+        concat_part_files(part_dirs, out_dir, PER_TABLE_FILES)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if stats_flag == 'a':
+        add_sketches(kg_stats, merge_sketches)
+        kg_stats.close()
+
+
+'''
+    Merge the sketches that have been written by previous runs (e.g. for other shards of the KG) into the statistics.
+'''
+
+
+def add_sketches(kg_stats, sketch_files):
+    if not sketch_files:
+        return
+    if kg_stats.sketch is None:
+        raise ValueError('Sketches can only be merged in the approximate mode (-a).')
+    for sketch_file in sketch_files.split(','):
+        print('Merging sketches {}'.format(sketch_file))
+        kg_stats.sketch.merge(CellColumnSketch.load(sketch_file))
+
+
+def get_memory_budget(arg):
+    return None if arg.memory_budget is None else arg.memory_budget * 1024 * 1024
+
+
+def get_sketch_args(arg):
+    if not arg.approx:
+        return None
+    return {'eps': arg.eps, 'delta': arg.delta, 'heavy_hitters': arg.heavy_hitters, 'distinct_error': arg.distinct_error}
 
 
 if __name__ == '__main__':
     arg = get_arguments()
-    isFile = os.path.isfile(arg.input_kg_files)
+    kg_files = get_kg_files(arg.input_kg_files)
+    sketch_args = get_sketch_args(arg)
+    memory_budget = get_memory_budget(arg)
 
-    if not isFile:
-        onlyfiles = [f for f in os.listdir(arg.input_kg_files) if isfile(join(arg.input_kg_files, f)) if 'wikitbls_kg_' in f]
-        for file in onlyfiles:
+    if arg.workers > 1:
+        gather_stats_parallel(kg_files, arg.out_dir, arg.stats_flag, arg.workers, sketch_args, arg.merge_sketches, memory_budget)
+    else:
+        kg_stats = KGStats(arg.out_dir, sketch_args=sketch_args, memory_budget=memory_budget)
+        for file in kg_files:
             print('Parsing file {}'.format(file))
             if arg.stats_flag == 'a':
-                __parse_kg_by_table(file, arg.out_dir)
+                kg_stats.add_file(file)
             else:
-                __num_triples_per_table(file, arg.out_dir)
-    else:
-        print('Parsing file {}'.format(arg.input_kg_files))
+                num_triples_per_table(file, arg.out_dir)
+
         if arg.stats_flag == 'a':
-            __parse_kg_by_table(arg.input_kg_files, arg.out_dir)
-        else:
-            __num_triples_per_table(arg.input_kg_files, arg.out_dir)
+            add_sketches(kg_stats, arg.merge_sketches)
+            kg_stats.close()
@@ -0,0 +1,204 @@
+'''
+    Instrumentation of the KG construction. The metrics are collected in a single (per-process) instance, which is
+    disabled by default, in which case all calls are no-ops. Once enabled, we record
+        stages          wall and CPU time of every stage (stages may be nested, i.e. the times are inclusive)
+        counters        e.g. tables, rows, cells, triples and bytes
+        rss             the RSS of the process, sampled periodically in a background thread
+        slow tables     the top-N table IDs with the highest processing time
+        profile         optionally, a cProfile of a sampled subset of the tables
+
+    and write them as a JSON report. The stages, counters and slow tables may be updated from several threads (e.g. the
+    pipeline workers), whereas the profiling is only supported with a single thread processing the tables.
+'''
+
+import cProfile
+import heapq
+import io
+import json
+import pstats
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+NULL_CONTEXT = nullcontext()
+
+
+def get_rss_mb():
+    try:
+        with open('/proc/self/statm', 'rt') as fin:
+            return int(fin.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        # the peak RSS, if the current RSS is not available
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.start_time = None
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = Counter()
+
+        self.rss_samples = []
+        self.rss_interval = None
+        self.rss_thread = None
+        self.rss_stop = threading.Event()
+
+        self.num_slow_tables = 0
+        self.slow_tables = []
+
+        self.profile_every = 0
+        self.profiler = None
+        self.num_tables = 0
+        self.num_profiled = 0
+
+    '''
+        Enable the metrics. Every profile_every-th table is profiled, with 0 no table is profiled.
+    '''
+
+    def enable(self, rss_interval=1.0, num_slow_tables=20, profile_every=0):
+        self.enabled = True
+        self.start_time = time.perf_counter()
+        self.num_slow_tables = num_slow_tables
+        self.profile_every = profile_every
+        if profile_every > 0:
+            self.profiler = cProfile.Profile()
+
+        self.rss_interval = rss_interval
+        if rss_interval:
+            self.rss_thread = threading.Thread(target=self.__sample_rss, daemon=True)
+            self.rss_thread.start()
+
+    '''
+        Start over with the same settings, e.g. in a worker process, which neither inherits the RSS sampling thread nor
+        should report the metrics of its parent. The given settings (see enable) override the current ones and enable
+        the metrics, e.g. in a worker process that has not inherited the state of its parent (spawn or forkserver). The
+        RSS sampling thread of the current metrics is stopped first, such that it does not sample into the new ones.
+    '''
+
+    def restart(self, **settings):
+        if not self.enabled and not settings:
+            return
+        if self.enabled:
+            settings = dict({'rss_interval': self.rss_interval, 'num_slow_tables': self.num_slow_tables,
+                             'profile_every': self.profile_every}, **settings)
+        self.__stop_rss()
+        self.__init__()
+        self.enable(**settings)
+
+    def __stop_rss(self):
+        self.rss_stop.set()
+        if self.rss_thread is not None and self.rss_thread.is_alive():
+            self.rss_thread.join()
+
+    def __sample_rss(self):
+        while True:
+            self.rss_samples.append((round(time.perf_counter() - self.start_time, 3), round(get_rss_mb(), 1)))
+            if self.rss_stop.wait(self.rss_interval):
+                return
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_CONTEXT
+        return self.__stage(name)
+
+    @contextmanager
+    def __stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            with self.lock:
+                stats = self.stages.get(name)
+                if stats is None:
+                    stats = self.stages[name] = {'calls': 0, 'wall_sec': 0.0, 'cpu_sec': 0.0}
+                stats['calls'] += 1
+                stats['wall_sec'] += wall
+                stats['cpu_sec'] += cpu
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    '''
+        Mark the start and end of the processing of a table, the returned token has to be passed to end_table. The
+        processing time is used for the slow-table log, and a sample of the tables is profiled.
+    '''
+
+    def start_table(self):
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            self.num_tables += 1
+            profiled = self.profile_every > 0 and self.num_tables % self.profile_every == 0
+        if profiled:
+            self.profiler.enable()
+        return time.perf_counter(), profiled
+
+    '''
+        The table_id is None if there was no table to process (e.g. at the end of a generator of tables).
+    '''
+
+    def end_table(self, token, table_id):
+        if token is None:
+            return
+
+        start, profiled = token
+        if profiled:
+            self.profiler.disable()
+            self.num_profiled += 1
+        if table_id is None:
+            return
+
+        entry = (time.perf_counter() - start, str(table_id))
+        with self.lock:
+            if len(self.slow_tables) < self.num_slow_tables:
+                heapq.heappush(self.slow_tables, entry)
+            elif self.num_slow_tables > 0 and entry > self.slow_tables[0]:
+                heapq.heapreplace(self.slow_tables, entry)
+
+    def __get_profile(self, profile_path, top_functions=30):
+        if self.profiler is None or self.num_profiled == 0:
+            return None
+
+        self.profiler.dump_stats(profile_path)
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(top_functions)
+        return {'profiled_tables': self.num_profiled, 'stats_file': profile_path, 'top_functions': out.getvalue().splitlines()}
+
+    def get_report(self, profile_path=None):
+        return {'wall_sec': time.perf_counter() - self.start_time,
+                'cpu_sec': time.process_time(),
+                'peak_rss_mb': max([rss for _, rss in self.rss_samples] + [get_rss_mb()]),
+                'stages': self.stages,
+                'counters': dict(self.counters),
+                'slow_tables': [{'table_id': table_id, 'sec': sec} for sec, table_id in sorted(self.slow_tables, reverse=True)],
+                'rss_samples': self.rss_samples,
+                'profile': None if profile_path is None else self.__get_profile(profile_path)}
+
+    '''
+        Write the JSON report, along with the cProfile stats of the sampled tables (into <path>.prof).
+    '''
+
+    def write_report(self, path):
+        if not self.enabled:
+            return
+
+        self.__stop_rss()
+        with open(path, 'wt') as fout:
+            json.dump(self.get_report(path + '.prof'), fout, indent=2)
+        print('Wrote the metrics report {}.'.format(path))
+
+
+metrics = Metrics()
@@ -0,0 +1,84 @@
+'''
+    The encoding of the terms of the WikiTablesKG as written by Tbl2KgMapper. There are three kinds of encoded terms:
+        names       entities, column names, column types and the literal cell values, which are normalized ('_' for
+                    spaces and '' for ") and percent-encoded, and are used within IRIs (and some literals)
+        documents   the entities and sections of the document and source IRIs of the tables, in which only the spaces
+                    are replaced before they are percent-encoded
+        literals    captions and column names, which are escaped according to the N-Triples grammar, i.e. only ", \\,
+                    line feeds and carriage returns are escaped
+
+    The same entities, column names and types reappear across many tables, hence, the encoded names are memoized in
+    bounded LRU caches, whose hit rates are reported in the metrics.
+'''
+
+import re
+from functools import lru_cache
+from urllib.parse import quote_plus
+
+from metrics import metrics
+
+LITERAL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'})
+LITERAL_UNESCAPES = {'\\\\': '\\', '\\"': '"', '\\n': '\n', '\\r': '\r'}
+ESCAPE_RE = re.compile(r'\\[\\"nr]')
+
+
+def normalize_name(name):
+    return name.replace('"', '\'\'').replace(' ', '_')
+
+
+def encode_name(name):
+    return quote_plus(normalize_name(name))
+
+
+def encode_document_name(name):
+    return quote_plus(name.replace(' ', '_'))
+
+
+'''
+    Escape a literal in a single pass. The unescaping only replaces the escapes written by escape_literal and keeps any
+    other backslash as it is.
+'''
+
+
+def escape_literal(value):
+    return value.translate(LITERAL_ESCAPES)
+
+
+def unescape_literal(value):
+    if '\\' not in value:
+        return value
+    return ESCAPE_RE.sub(lambda match: LITERAL_UNESCAPES[match.group(0)], value)
+
+
+'''
+    The encoder of a mapper. The names of entities, columns and types (used in IRIs) and the literal cell values have
+    separate caches, such that the long tail of distinct cell values does not evict the frequent entities. The document
+    names share the cache size of the names.
+'''
+
+
+class NTEncoder:
+    def __init__(self, iri_cache_size=500000, value_cache_size=200000):
+        self.encode_iri = lru_cache(maxsize=iri_cache_size)(encode_name)
+        self.encode_value = lru_cache(maxsize=value_cache_size)(encode_name)
+        self.encode_document = lru_cache(maxsize=iri_cache_size)(encode_document_name)
+        self.encode_literal = escape_literal
+
+    def get_stats(self):
+        stats = {}
+        for name, cache in (('iri', self.encode_iri), ('value', self.encode_value)):
+            info = cache.cache_info()
+            stats[name + '_cache_hits'] = info.hits
+            stats[name + '_cache_misses'] = info.misses
+            stats[name + '_cache_size'] = info.currsize
+        return stats
+
+    def get_hit_rate(self, name='iri'):
+        stats = self.get_stats()
+        lookups = stats[name + '_cache_hits'] + stats[name + '_cache_misses']
+        return stats[name + '_cache_hits'] / lookups if lookups else 0.0
+
+    def report(self):
+        stats = self.get_stats()
+        for name in ('iri_cache_hits', 'iri_cache_misses', 'value_cache_hits', 'value_cache_misses'):
+            metrics.count(name, stats[name])
@@ -0,0 +1,206 @@
+'''
+    Buffered writer for the N-Triples output of the knowledge graph. The output can be compressed with any of the
+    standard library codecs, and it can be split into several files of a maximum size.
+
+    The files are written to a temporary path (.tmp) and only renamed once they are complete. With checkpoints, the
+    number of written tables and the position in the current file are periodically recorded in a checkpoint file, from
+    which an interrupted run is resumed, i.e. the current file is truncated to the recorded position and the writing
+    continues with the next table.
+'''
+
+import bz2
+import gzip
+import json
+import lzma
+import os
+
+COMPRESSIONS = {'none': '', 'gz': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+
+
+class NTriplesWriter:
+    def __init__(self, out_dir, suffix, compression='none', max_file_size=None, buffer_size=1 << 20, compresslevel=6, checkpoint_interval=None, resume=False):
+        if compression not in COMPRESSIONS:
+            raise ValueError('Unknown compression {}, use one of {}.'.format(compression, ', '.join(COMPRESSIONS)))
+
+        self.out_dir = out_dir
+        self.suffix = suffix
+        self.compression = compression
+        self.max_file_size = max_file_size
+        self.buffer_size = buffer_size
+        self.compresslevel = compresslevel
+
+        self.buffer = []
+        self.buffer_len = 0
+        self.part = 0
+        self.paths = []
+
+        # the raw file and the (compressed) stream on top of it.
+        self.raw = None
+        self.stream = None
+
+        # number of (uncompressed) bytes and tables written so far.
+        self.bytes_written = 0
+        self.num_tables = 0
+
+        # write a checkpoint every checkpoint_interval tables.
+        self.checkpoint_interval = checkpoint_interval
+        self.finished = False
+        if resume:
+            self.__resume()
+
+    '''
+        The output file is wikitbls_kg_<suffix>.nt(.gz|.bz2|.xz). If the output is split by size, the file part is
+        added, i.e. wikitbls_kg_<suffix>.part<part>.nt(.gz|.bz2|.xz).
+    '''
+
+    def get_path(self, part):
+        file_name = 'wikitbls_kg_' + self.suffix
+        if self.max_file_size is not None:
+            file_name += '.part{:04d}'.format(part)
+        return self.out_dir + '/' + file_name + '.nt' + COMPRESSIONS[self.compression]
+
+    def open_stream(self, raw):
+        if self.compression == 'gz':
+            return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=self.compresslevel)
+        elif self.compression == 'bz2':
+            return bz2.BZ2File(raw, mode='wb', compresslevel=self.compresslevel)
+        elif self.compression == 'xz':
+            return lzma.LZMAFile(raw, mode='wb')
+        return raw
+
+    def __open_part(self):
+        path = self.get_path(self.part)
+        self.paths.append(path)
+        self.raw = open(path + '.tmp', 'wb')
+        self.stream = self.open_stream(self.raw)
+
+    '''
+        Make everything written so far durable. A compressed stream is closed (and a new one started on the same file),
+        such that the file up to the current position is complete, e.g. a multi-member gzip file.
+    '''
+
+    def __sync_part(self):
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+
+    def __close_part(self):
+        self.__sync_part()
+        self.raw.close()
+        self.raw = self.stream = None
+        os.replace(self.paths[-1] + '.tmp', self.paths[-1])
+
+    '''
+        Add the triples of a table. The data is only written once the buffer is full, and the output is only split
+        between calls to write, i.e. the triples of a table are never split across files.
+    '''
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffer_len += len(data)
+        self.num_tables += 1
+        if self.buffer_len >= self.buffer_size:
+            self.flush()
+        if self.checkpoint_interval is not None and self.num_tables % self.checkpoint_interval == 0:
+            self.checkpoint()
+
+    def flush(self):
+        if self.stream is None:
+            self.__open_part()
+
+        if self.buffer:
+            data = ''.join(self.buffer).encode('utf-8')
+            self.buffer.clear()
+            self.buffer_len = 0
+            self.stream.write(data)
+            self.bytes_written += len(data)
+
+        # the size of the file on disk, for compressed files this excludes what is still kept by the compressor.
+        if self.max_file_size is not None and self.raw.tell() >= self.max_file_size:
+            self.__close_part()
+            self.part += 1
+            if self.checkpoint_interval is not None:
+                self.__write_checkpoint()
+
+    def close(self):
+        # we do not open a new empty part if the output has just been split, however, we always create one file.
+        if self.buffer or len(self.paths) == 0:
+            self.flush()
+        if self.stream is not None:
+            self.__close_part()
+
+        self.finished = True
+        if self.checkpoint_interval is not None:
+            self.__write_checkpoint()
+
+    '''
+        The checkpoint is wikitbls_kg_<suffix>.ckpt.json, it is written to a temporary file and renamed, such that it
+        always refers to a consistent state of the output.
+    '''
+
+    def checkpoint(self):
+        self.flush()
+        if self.stream is None:
+            self.__write_checkpoint()
+            return
+
+        self.__sync_part()
+        self.__write_checkpoint()
+        if self.stream is not self.raw:
+            self.stream = self.open_stream(self.raw)
+
+    def __write_checkpoint(self):
+        state = {'num_tables': self.num_tables, 'bytes_written': self.bytes_written, 'part': self.part, 'paths': self.paths,
+                 'position': 0 if self.raw is None else self.raw.tell(), 'finished': self.finished}
+
+        path = get_checkpoint_path(self.out_dir, self.suffix)
+        with open(path + '.tmp', 'wt') as fout:
+            json.dump(state, fout)
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(path + '.tmp', path)
+
+    '''
+        Continue from the last checkpoint. If the run has been interrupted after a file has been completed but before
+        the next checkpoint, the file is opened again and truncated as well.
+    '''
+
+    def __resume(self):
+        state = load_checkpoint(self.out_dir, self.suffix)
+        if state is None:
+            return
+
+        self.num_tables = state['num_tables']
+        self.bytes_written = state['bytes_written']
+        self.part = state['part']
+        self.paths = state['paths']
+        self.finished = state['finished']
+        if self.finished:
+            return
+
+        path = self.get_path(self.part)
+        if state['position'] == 0:
+            # the current file has not been written yet, it is created again
+            if self.paths and self.paths[-1] == path:
+                self.paths.pop()
+            return
+
+        if not os.path.isfile(path + '.tmp'):
+            os.replace(path, path + '.tmp')
+        self.raw = open(path + '.tmp', 'r+b')
+        self.raw.truncate(state['position'])
+        self.raw.seek(state['position'])
+        self.stream = self.open_stream(self.raw)
+
+
+def get_checkpoint_path(out_dir, suffix):
+    return out_dir + '/wikitbls_kg_' + suffix + '.ckpt.json'
+
+
+def load_checkpoint(out_dir, suffix):
+    path = get_checkpoint_path(out_dir, suffix)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rt') as fin:
+        return json.load(fin)
@@ -0,0 +1,166 @@
+'''
+    Pipelined mapping of the tables into the KG within a single process. The stages run in their own threads and are
+    connected by bounded queues, such that a stage blocks (backpressure) if the next one falls behind:
+        reader      reads (and decompresses) the entity lines of the tables file and decodes them, such that the tables
+                    before start are dropped before they are typed and the reading stops after start + limit tables
+        workers     type the tables of the entity lines and map them to N-Triples
+        writer      writes the triples of the tables in the input order (by the sequence numbers of the lines), and
+                    passes them to the sinks of the mapper
+
+    Decompression, compression and disk I/O release the GIL, hence, they overlap with the parsing and mapping.
+'''
+
+import queue
+import threading
+
+import data_utils as du
+from metrics import metrics
+
+DONE = None
+
+
+class TablePipeline:
+    def __init__(self, tables_file, mapper, start=0, limit=None, tax=None, ecats=None, num_workers=1, queue_size=64):
+        self.tables_file = tables_file
+        self.mapper = mapper
+        self.start = start
+        self.limit = limit
+        self.tax = tax
+        self.ecats = ecats
+        self.num_workers = num_workers
+        # a cProfile profiler cannot be shared by several threads
+        if num_workers > 1 and metrics.profiler is not None:
+            raise ValueError('The tables cannot be profiled with more than one pipeline worker.')
+
+        self.lines = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue(maxsize=queue_size)
+
+        # set once a stage failed, the other stages then stop as well
+        self.stop = threading.Event()
+        self.errors = []
+
+        self.num_tables = 0
+        self.bytes_written = 0
+
+    def __put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __get(self, q):
+        while not self.stop.is_set():
+            try:
+                return True, q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return False, None
+
+    def __run(self, stage, *args):
+        try:
+            stage(*args)
+        except BaseException as e:
+            self.errors.append(e)
+            self.stop.set()
+
+    '''
+        The tables are counted in the same way as in data_utils.iter_table_json, i.e. the tables before start are skipped
+        and at most limit tables are passed on. Only the lines with tables in this range are passed to the workers.
+    '''
+
+    def __read(self, reader, count):
+        seq = 0
+        loaded_tables = 0
+        try:
+            for line in reader:
+                tables = []
+                for table in du.parse_table_line(line):
+                    count += 1
+                    if count < self.start:
+                        continue
+
+                    loaded_tables += 1
+                    if self.limit is not None and loaded_tables > self.limit:
+                        break
+                    tables.append(table)
+
+                if tables:
+                    if not self.__put(self.lines, (seq, tables)):
+                        return
+                    seq += 1
+                if self.limit is not None and loaded_tables > self.limit:
+                    return
+        finally:
+            reader.close()
+            for _ in range(self.num_workers):
+                self.__put(self.lines, DONE)
+
+    def __work(self):
+        while True:
+            ok, item = self.__get(self.lines)
+            if not ok or item is DONE:
+                self.__put(self.results, DONE)
+                return
+
+            seq, tables = item
+            data = []
+            for table, entity_label, section_label in tables:
+                # the processing time of a table (for the slow-table log and the profiling) includes its typing and mapping
+                token = metrics.start_table()
+                tbl_obj = du.load_table(table, entity_label, section_label, tax=self.tax, ecats=self.ecats)
+                with metrics.stage('serialize'):
+                    data.append((tbl_obj, self.mapper.map_table_to_resource(tbl_obj)))
+                metrics.end_table(token, tbl_obj.table_id)
+            if not self.__put(self.results, (seq, data)):
+                return
+
+    '''
+        Write the results in the order of the lines.
+    '''
+
+    def __write(self, writer):
+        pending = {}
+        next_seq = 0
+        num_done = 0
+        while num_done < self.num_workers:
+            ok, item = self.__get(self.results)
+            if not ok:
+                return
+            if item is DONE:
+                num_done += 1
+                continue
+
+            pending[item[0]] = item[1]
+            while next_seq in pending:
+                for tbl_obj, data in pending.pop(next_seq):
+                    with metrics.stage('write'):
+                        writer.write(data)
+                    self.mapper.add_to_sinks(tbl_obj, data)
+                    self.mapper.count_table(tbl_obj, data)
+                    self.num_tables += 1
+                next_seq += 1
+
+    def run(self):
+        reader, count = du.open_table_lines(self.tables_file, start=self.start)
+        writer = self.mapper.get_writer()
+
+        threads = [threading.Thread(target=self.__run, args=(self.__read, reader, count))]
+        threads += [threading.Thread(target=self.__run, args=(self.__work,)) for _ in range(self.num_workers)]
+        threads.append(threading.Thread(target=self.__run, args=(self.__write, writer)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        with metrics.stage('write'):
+            writer.close()
+        self.mapper.finish()
+        self.bytes_written = writer.bytes_written
+        metrics.count('bytes', self.bytes_written)
+        print('Finished writing all the data into the knowledge graph ({:d} tables, {:d} bytes).'.format(self.num_tables, self.bytes_written))
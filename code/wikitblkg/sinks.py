@@ -0,0 +1,72 @@
+'''
+    Sinks that consume the tables along with their triples while they are written into the KG, such that the table and
+    KG statistics are gathered in the same pass over the tables, instead of parsing and typing the tables again
+    (table_stats.py) or reading the KG back from disk (kg_stats.py). A sink implements
+        add_table(table, data)  where data are the N-Triples of the table (or None if the table is not mapped)
+        close()                 write the remaining output
+
+    and is passed to Tbl2KgMapper (or the TablePipeline through its mapper).
+'''
+
+from kg_stats import KGStats
+
+
+def format_table_stats(table):
+    table_out = '{:d}\t{}\t{}\t{:d}'.format(table.table_id, table.entity, table.section, len(table.table_rows))
+
+    # the column types are only assigned to the last layer of columns.
+    out = []
+    for col_idx, column in enumerate(table.columns[-1]):
+        out.append('{}\t{:d}\t{}\t{}\n'.format(table_out, col_idx, column, table.column_types[column]))
+    return ''.join(out)
+
+
+'''
+    The per-column statistics of table_stats.py, i.e. the table ID, entity, section, number of rows, column position,
+    name and type, appended to the given file.
+'''
+
+
+class TableStatsSink:
+    def __init__(self, out_file, buffer_size=100000):
+        self.fout = open(out_file, 'a', encoding='utf_8')
+        self.buffer_size = buffer_size
+        self.out = []
+        self.out_size = 0
+
+    def add_table(self, table, data):
+        table_out = format_table_stats(table)
+        self.out.append(table_out)
+        self.out_size += len(table_out)
+        if self.out_size > self.buffer_size:
+            self.fout.write(''.join(self.out))
+            self.out.clear()
+            self.out_size = 0
+
+    def close(self):
+        self.fout.write(''.join(self.out))
+        self.out.clear()
+        self.fout.close()
+
+
+'''
+    The statistics of kg_stats.py (-f a), computed from the triples of the tables as they are mapped. With partial=True,
+    only the per-table statistics are written on close, whereas the aggregated statistics are kept in kg_stats, such
+    that they can be merged with the ones of other shards (see KGStats.merge).
+'''
+
+
+class KGStatsSink:
+    def __init__(self, out_dir, sketch_args=None, memory_budget=None, partial=False):
+        self.kg_stats = KGStats(out_dir, sketch_args=sketch_args, memory_budget=memory_budget)
+        self.partial = partial
+
+    def add_table(self, table, data):
+        self.kg_stats.add_data(data)
+
+    def close(self):
+        if self.partial:
+            self.kg_stats.flush()
+            self.kg_stats.spill_counts()
+        else:
+            self.kg_stats.close()
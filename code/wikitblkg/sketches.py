@@ -0,0 +1,191 @@
+'''
+    Mergeable sketches for approximate statistics over streams that are too large to count exactly.
+        CountMinSketch  frequency estimates, overestimating a count by at most eps * N with probability 1 - delta
+        HeavyHitters    the (at most) k most frequent keys (Misra-Gries), missing no key with a count above N / (k + 1)
+        HyperLogLog     distinct counts with a relative standard error of about 1.04 / sqrt(2^p)
+
+    All sketches with the same parameters can be merged, e.g. when they are computed for different shards, and they are
+    serialized in the snapshot format (see data_prep.snapshot).
+'''
+
+import hashlib
+import math
+from array import array
+
+from data_prep import snapshot
+
+MASK_64 = (1 << 64) - 1
+
+
+def hash128(key):
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+
+class CountMinSketch:
+    def __init__(self, eps=0.0001, delta=0.01, width=None, depth=None):
+        self.width = int(math.ceil(math.e / eps)) if width is None else width
+        self.depth = int(math.ceil(math.log(1.0 / delta))) if depth is None else depth
+        self.table = array('q', [0]) * (self.width * self.depth)
+        self.total = 0
+
+    def __positions(self, h1, h2):
+        # the depth hash functions are derived from two hashes (Kirsch-Mitzenmacher)
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        self.add_hash(hash128(key), count)
+
+    def add_hash(self, h, count=1):
+        table = self.table
+        for pos in self.__positions(h[0], h[1]):
+            table[pos] += count
+        self.total += count
+
+    def estimate(self, key):
+        table = self.table
+        return min(table[pos] for pos in self.__positions(*hash128(key)))
+
+    def merge(self, other):
+        if self.width != other.width or self.depth != other.depth:
+            raise ValueError('Cannot merge Count-Min sketches of different dimensions.')
+        table = self.table
+        other_table = other.table
+        for pos in range(len(table)):
+            table[pos] += other_table[pos]
+        self.total += other.total
+
+    def get_state(self):
+        return {'width': self.width, 'depth': self.depth, 'total': self.total}, {'table': self.table}
+
+    @staticmethod
+    def from_state(meta, sections):
+        sketch = CountMinSketch(width=meta['width'], depth=meta['depth'])
+        sketch.table = array('q', sections['table'])
+        sketch.total = meta['total']
+        return sketch
+
+
+class HeavyHitters:
+    def __init__(self, k=1000):
+        self.k = k
+        self.counters = {}
+
+    def add(self, key, count=1):
+        counters = self.counters
+        if key in counters:
+            counters[key] += count
+        elif len(counters) < self.k:
+            counters[key] = count
+        else:
+            # decrement all the counters, the number of decrements is bounded by the number of increments
+            decrement = min(count, min(counters.values()))
+            for other_key in list(counters):
+                counters[other_key] -= decrement
+                if counters[other_key] <= 0:
+                    del counters[other_key]
+            if count > decrement:
+                counters[key] = count - decrement
+
+    '''
+        Merge two Misra-Gries summaries: add the counters and subtract the (k + 1)-th largest counter from all of them.
+    '''
+
+    def merge(self, other):
+        counters = self.counters
+        for key, count in other.counters.items():
+            counters[key] = counters.get(key, 0) + count
+
+        if len(counters) > self.k:
+            kth = sorted(counters.values(), reverse=True)[self.k]
+            self.counters = {key: count - kth for key, count in counters.items() if count > kth}
+
+    def keys(self):
+        return list(self.counters)
+
+    def get_state(self):
+        return {'k': self.k, 'counters': list(self.counters.items())}, {}
+
+    @staticmethod
+    def from_state(meta, sections):
+        sketch = HeavyHitters(meta['k'])
+        sketch.counters = dict(meta['counters'])
+        return sketch
+
+
+class HyperLogLog:
+    def __init__(self, rel_err=0.01, p=None):
+        self.p = max(4, min(18, int(math.ceil(math.log2((1.04 / rel_err) ** 2))))) if p is None else p
+        self.m = 1 << self.p
+        self.registers = bytearray(self.m)
+
+    def add(self, key):
+        self.add_hash(hash128(key))
+
+    def add_hash(self, h):
+        h = h[0]
+        idx = h >> (64 - self.p)
+        w = (h << self.p) & MASK_64
+        rho = 64 - self.p + 1 if w == 0 else 64 - w.bit_length() + 1
+        if rho > self.registers[idx]:
+            self.registers[idx] = rho
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # small range correction (linear counting)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if self.p != other.p:
+            raise ValueError('Cannot merge HyperLogLog sketches of different precision.')
+        registers = self.registers
+        for idx, r in enumerate(other.registers):
+            if r > registers[idx]:
+                registers[idx] = r
+
+    def get_state(self):
+        return {'p': self.p}, {'registers': self.registers}
+
+    @staticmethod
+    def from_state(meta, sections):
+        sketch = HyperLogLog(p=meta['p'])
+        sketch.registers = bytearray(sections['registers'])
+        return sketch
+
+
+SKETCH_TYPES = {'CountMinSketch': CountMinSketch, 'HeavyHitters': HeavyHitters, 'HyperLogLog': HyperLogLog}
+
+'''
+    Write a dictionary of name -> sketch into a single file, the sections of a sketch are prefixed with its name.
+'''
+
+
+def write_sketches(path, sketches, meta=None):
+    header_meta = {'meta': {} if meta is None else meta, 'sketches': {}}
+    sections = {}
+    for name, sketch in sketches.items():
+        sketch_meta, sketch_sections = sketch.get_state()
+        header_meta['sketches'][name] = [type(sketch).__name__, sketch_meta]
+        for section, data in sketch_sections.items():
+            sections[name + '.' + section] = data
+    snapshot.write_snapshot(path, 'sketches', sections, meta=header_meta)
+
+
+def read_sketches(path):
+    header, sections = snapshot.open_snapshot(path)
+    if header['kind'] != 'sketches':
+        raise ValueError('The file {} does not contain sketches.'.format(path))
+
+    sketches = {}
+    for name, (sketch_type, sketch_meta) in header['meta']['sketches'].items():
+        prefix = name + '.'
+        sketch_sections = {section[len(prefix):]: data for section, data in sections.items() if section.startswith(prefix)}
+        sketches[name] = SKETCH_TYPES[sketch_type].from_state(sketch_meta, sketch_sections)
+    return sketches, header['meta']['meta']
@@ -0,0 +1,129 @@
+'''
+    Exact counting of string keys under a memory budget. The counts are kept in memory until their (estimated) size
+    reaches the budget, at which point they are written as a run sorted by key into a temporary file. At the end all the
+    runs are merged (k-way, with heapq.merge), such that the counts of a key are summed up across runs.
+'''
+
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+
+# the approximate memory of a dictionary entry besides the key, i.e. the slot, the hash and the int count.
+ENTRY_OVERHEAD = 100
+
+
+class SpillingCounter:
+    def __init__(self, tmp_dir, memory_budget, buffer_size=1 << 20, max_open_runs=256):
+        self.tmp_dir = tmp_dir
+        self.run_dir = None
+        self.memory_budget = memory_budget
+        self.buffer_size = buffer_size
+        self.max_open_runs = max_open_runs
+
+        self.counts = {}
+        self.memory = 0
+        self.runs = []
+        self.num_runs = 0
+
+    def add(self, key, count=1):
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+            return
+
+        counts[key] = count
+        self.memory += sys.getsizeof(key) + ENTRY_OVERHEAD
+        if self.memory >= self.memory_budget:
+            self.spill()
+
+    '''
+        Write the counts as a run of key\tcount lines sorted by key. The keys must not contain line breaks.
+    '''
+
+    def spill(self):
+        if len(self.counts) == 0:
+            return
+
+        counts = self.counts
+        self.__write_run(((key, counts[key]) for key in sorted(counts)))
+        self.counts = {}
+        self.memory = 0
+
+    def __write_run(self, items):
+        path = self.__next_run_path()
+        with open(path, 'wt', encoding='utf_8', buffering=self.buffer_size) as fout:
+            out = []
+            for key, count in items:
+                out.append('{}\t{:d}\n'.format(key, count))
+                if len(out) >= 10000:
+                    fout.write(''.join(out))
+                    out.clear()
+            fout.write(''.join(out))
+        self.runs.append(path)
+
+    '''
+        The path of the next run, the directory of the runs is only created once we spill.
+    '''
+
+    def __next_run_path(self):
+        if self.run_dir is None:
+            self.run_dir = tempfile.mkdtemp(prefix='spill_', dir=self.tmp_dir)
+        self.num_runs += 1
+        return os.path.join(self.run_dir, 'run_{:06d}.tsv'.format(self.num_runs))
+
+    '''
+        Add the counts of another SpillingCounter (e.g. of another process), whose runs are taken over.
+    '''
+
+    def merge(self, other):
+        for run in other.runs:
+            path = self.__next_run_path()
+            shutil.move(run, path)
+            self.runs.append(path)
+        other.runs = []
+
+        for key, count in other.counts.items():
+            self.add(key, count)
+
+    def __iter_run(self, path):
+        with open(path, 'rt', encoding='utf_8', buffering=self.buffer_size) as fin:
+            for line in fin:
+                key, count = line[:-1].rsplit('\t', 1)
+                yield key, int(count)
+
+    def __merge_runs(self, runs):
+        key = None
+        count = 0
+        for next_key, next_count in heapq.merge(*[self.__iter_run(run) for run in runs], key=lambda x: x[0]):
+            if next_key != key:
+                if key is not None:
+                    yield key, count
+                key = next_key
+                count = 0
+            count += next_count
+
+        if key is not None:
+            yield key, count
+
+    '''
+        Iterate over the (key, count) pairs sorted by key. If there are more runs than we can open at once, the runs are
+        first merged in groups of max_open_runs.
+    '''
+
+    def items(self):
+        self.spill()
+        while len(self.runs) > self.max_open_runs:
+            runs = self.runs[:self.max_open_runs]
+            self.runs = self.runs[self.max_open_runs:]
+            self.__write_run(self.__merge_runs(runs))
+            for run in runs:
+                os.remove(run)
+        return self.__merge_runs(self.runs)
+
+    def close(self):
+        if self.run_dir is not None:
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+        self.runs = []
+        self.counts = {}
@@ -0,0 +1,144 @@
+'''
+    Generate a synthetic TableNet corpus in the formats of the real input: the entity-table JSON lines, the flat
+    category taxonomy and the entity category associations. The corpus is fully determined by the scale arguments and
+    the seed, such that it can be used for benchmarks (see benchmark.py).
+'''
+
+import argparse
+import gzip
+import json
+import os
+import random
+
+TABLES_FILE = 'tables.json.gz'
+TAXONOMY_FILE = 'taxonomy.tsv.gz'
+ENTITY_CATS_FILE = 'entity_cats.tsv.gz'
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Use this script to generate a synthetic TableNet corpus.')
+    parser.add_argument('-o', '--out_dir', help='The output directory for the corpus files.', required=True)
+    parser.add_argument('-nt', '--num_tables', help='The number of tables.', type=int, default=10000)
+    parser.add_argument('-tpe', '--tables_per_entity', help='The maximum number of tables of an entity.', type=int, default=5)
+    parser.add_argument('-r', '--rows', help='The maximum number of rows of a table.', type=int, default=20)
+    parser.add_argument('-c', '--columns', help='The maximum number of columns of a table.', type=int, default=6)
+    parser.add_argument('-sr', '--struct_ratio', help='The ratio of cells that link to entities (STRUCT).', type=float, default=0.5)
+    parser.add_argument('-ne', '--num_entities', help='The number of entities in the entity categories.', type=int, default=10000)
+    parser.add_argument('-d', '--depth', help='The depth of the category taxonomy.', type=int, default=8)
+    parser.add_argument('-f', '--fanout', help='The number of child categories of a category.', type=int, default=4)
+    parser.add_argument('-mc', '--max_level_cats', help='The maximum number of categories per taxonomy level.', type=int, default=5000)
+    parser.add_argument('-s', '--seed', help='The random seed.', type=int, default=10)
+    return parser.parse_args()
+
+
+def get_corpus_paths(out_dir):
+    return os.path.join(out_dir, TABLES_FILE), os.path.join(out_dir, TAXONOMY_FILE), os.path.join(out_dir, ENTITY_CATS_FILE)
+
+
+'''
+    The taxonomy is written as lines of parent, parent level, child and child level. Every category below the root has
+    one or two parents on the level above it. Returns the categories of each level.
+'''
+
+
+def generate_taxonomy(path, depth, fanout, max_level_cats, rnd):
+    levels = [['Category_root']]
+    with gzip.open(path, 'wt', encoding='latin_1') as fout:
+        for level in range(1, depth + 1):
+            parents = levels[-1]
+            cats = ['Category_L{:d}_{:d}'.format(level, idx) for idx in range(min(len(parents) * fanout, max_level_cats))]
+            out = []
+            for idx, cat in enumerate(cats):
+                cat_parents = {parents[idx // fanout % len(parents)]}
+                if rnd.random() < 0.3:
+                    cat_parents.add(rnd.choice(parents))
+                for parent in sorted(cat_parents):
+                    out.append('{}\t{:d}\t{}\t{:d}\n'.format(parent, level - 1, cat, level))
+            fout.write(''.join(out))
+            levels.append(cats)
+    return levels
+
+
+'''
+    Every entity belongs to one to three categories, mostly of the lower levels of the taxonomy.
+'''
+
+
+def generate_entity_cats(path, entities, levels, rnd):
+    lower_cats = [cat for cats in levels[len(levels) // 2:] for cat in cats]
+    with gzip.open(path, 'wt', encoding='latin_1') as fout:
+        out = []
+        for entity in entities:
+            for cat in rnd.sample(lower_cats, min(len(lower_cats), rnd.randint(1, 3))):
+                out.append('{}\t{}\n'.format(entity, cat))
+        fout.write(''.join(out))
+
+
+def generate_cell(col_idx, column, entities, struct_ratio, rnd):
+    if rnd.random() < struct_ratio:
+        cell_entities = rnd.sample(entities, rnd.randint(1, 2))
+        return {'col_index': col_idx, 'column': column, 'value': ' '.join(cell_entities),
+                'structured_values': [{'structured': entity, 'anchor': entity} for entity in cell_entities]}
+    return {'col_index': col_idx, 'column': column, 'value': 'value {:d} "{:d}"'.format(rnd.randint(0, 10000), col_idx)}
+
+
+def generate_table(table_id, rows, columns, entities, struct_ratio, rnd):
+    num_cols = rnd.randint(1, columns)
+    col_names = ['Column {:d} (#{:d})'.format(col_idx, rnd.randint(0, 20)) for col_idx in range(num_cols)]
+
+    header = [{'columns': [{'name': name, 'value_dist': []} for name in col_names]}]
+    if rnd.random() < 0.1:
+        header.insert(0, {'columns': [{'name': 'Group', 'value_dist': []}]})
+
+    table_rows = []
+    for _ in range(rnd.randint(1, rows)):
+        table_rows.append({'values': [generate_cell(col_idx, name, entities, struct_ratio, rnd) for col_idx, name in enumerate(col_names)]})
+
+    caption = 'Table "{:d}" caption'.format(table_id) if rnd.random() < 0.7 else ''
+    return {'id': table_id, 'caption': caption, 'header': header, 'rows': table_rows}
+
+
+'''
+    The tables are grouped into entities (one JSON line each) with one or two sections.
+'''
+
+
+def generate_tables(path, num_tables, tables_per_entity, rows, columns, entities, struct_ratio, rnd):
+    table_id = 0
+    entity_idx = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as fout:
+        while table_id < num_tables:
+            sections = []
+            for section_idx in range(rnd.randint(1, 2)):
+                tables = []
+                for _ in range(rnd.randint(1, tables_per_entity)):
+                    if table_id >= num_tables:
+                        break
+                    table_id += 1
+                    tables.append(generate_table(table_id, rows, columns, entities, struct_ratio, rnd))
+                sections.append({'section': 'MAIN_SECTION' if section_idx == 0 else 'Section {:d}'.format(section_idx), 'tables': tables})
+
+            fout.write(json.dumps({'entity': 'Page {:d}'.format(entity_idx), 'sections': sections}) + '\n')
+            entity_idx += 1
+    return table_id
+
+
+def generate_corpus(out_dir, num_tables=10000, tables_per_entity=5, rows=20, columns=6, struct_ratio=0.5, num_entities=10000,
+                    depth=8, fanout=4, max_level_cats=5000, seed=10):
+    rnd = random.Random(seed)
+    tables_path, taxonomy_path, ecats_path = get_corpus_paths(out_dir)
+
+    levels = generate_taxonomy(taxonomy_path, depth, fanout, max_level_cats, rnd)
+    entities = ['entity_{:d}'.format(idx) for idx in range(num_entities)]
+    generate_entity_cats(ecats_path, entities, levels, rnd)
+    generate_tables(tables_path, num_tables, tables_per_entity, rows, columns, entities, struct_ratio, rnd)
+    print('Generated {:d} tables, {:d} categories and {:d} entities in {}.'.format(num_tables, sum(len(cats) for cats in levels), num_entities, out_dir))
+    return tables_path, taxonomy_path, ecats_path
+
+
+if __name__ == '__main__':
+    arg = get_arguments()
+    os.makedirs(arg.out_dir, exist_ok=True)
+    generate_corpus(arg.out_dir, num_tables=arg.num_tables, tables_per_entity=arg.tables_per_entity, rows=arg.rows, columns=arg.columns,
+                    struct_ratio=arg.struct_ratio, num_entities=arg.num_entities, depth=arg.depth, fanout=arg.fanout,
+                    max_level_cats=arg.max_level_cats, seed=arg.seed)
@@ -1,9 +1,9 @@
 import argparse
-import gzip
-import json
 
 import data_utils as du
+from data_prep import pruning
 from data_prep.table import Table
+from sinks import TableStatsSink
 
 
 def get_arguments():
@@ -12,54 +12,57 @@ def get_arguments():
     parser.add_argument('-o', '--out_dir', help='The output directory for storing the embeddings.', required=True)
     parser.add_argument('-t', '--taxonomy', help='The path to the flat category taxonomy.', required=True)
     parser.add_argument('-ec', '--entity_cat', help='The path to the entity category associations.', required=True)
-    return parser.parse_args()
-
-
-def gather_table_stats(infile, out_file, tax=None, ecats=None):
-    if infile.endswith('gz'):
-        reader = gzip.open(infile, 'r')
-    else:
-        reader = open(infile, 'r')
-
+    parser.add_argument('-sr', '--shared_resources', help='The shared KG resources (see compile_snapshot.py -r), which are memory-mapped instead of loading the taxonomy and entity categories.', required=False)
+    parser.add_argument('-pr', '--prune', help='Only load the categories of the entities in the tables (collected in a pre-pass) and their ancestors in the taxonomy.', action='store_true')
+    parser.add_argument('-pc', '--prune_cache', help='Cache the pruned taxonomy and entity categories in this directory.', required=False)
+    parser.add_argument('-lm', '--lca_max_entities', help='Type a column with at most this many distinct entities (an evenly spaced sample of the column).', type=du.positive_int, default=None)
+    parser.add_argument('-lp', '--lca_patience', help='Stop typing a column once this many consecutive entities did not change its common categories.', type=du.positive_int, default=None)
+    parser.add_argument('-s', '--start_offset', help='The start offset for loading the tables', type=int, default=0)
+    parser.add_argument('-dl', '--data_limit', help='The maximum number of tables for which we gather the stats.', type=int, default=None)
+    parser.add_argument('-rs', '--random_sample', help='Gather the stats of a random sample of -dl tables among all the tables from the start offset on.', action='store_true')
+    parser.add_argument('-ss', '--stratify', help='Stratify the random sample by the section or the size (number of rows) of the tables.', choices=['section', 'size'], default=None)
+    parser.add_argument('-sd', '--seed', help='The seed of the random sample.', type=int, default=10)
+    arg = parser.parse_args()
+    if arg.stratify is not None and not arg.random_sample:
+        parser.error('Only the random sample (-rs) can be stratified (-ss).')
+    return arg
+
+
+def gather_table_stats(infile, out_file, tax=None, ecats=None, start=0, limit=None, random_sample=False, stratify=None, seed=10):
     # read the tables data
-    fout = open(out_file, 'a', encoding='utf_8')
-    out_str = ''
-    for line in reader:
-        # parse the entity table json
-        entity_json = json.loads(line.strip())
-        entity_label = entity_json['entity']
-
-        # iterate through the sections
-        for section in entity_json['sections']:
-            section_label = section['section']
-
-            for table in section['tables']:
-                tbl_obj = Table(flat_taxonomy=tax, ecats=ecats)
-                tbl_obj.load_json(table, entity_label, section_label)
-
-                table_out = '{:d}\t{}\t{}\t{:d}'.format(tbl_obj.table_id, tbl_obj.entity, tbl_obj.section, len(tbl_obj.table_rows))
-
-                for col_idx, column in enumerate(tbl_obj.columns):
-                    tbl_col_out = '{}\t{:d}\t{}\t{}\n'.format(table_out, col_idx, column, tbl_obj.column_types[column])
-                    out_str += tbl_col_out
-
-            if len(out_str) > 100000:
-                fout.write(out_str)
-                out_str = ''
-    fout.write(out_str)
-    fout.close()
+    sink = TableStatsSink(out_file)
+    for table, entity_label, section_label in du.select_table_json(infile, start=start, limit=limit, random_sample=random_sample, stratify=stratify, seed=seed):
+        tbl_obj = Table(flat_taxonomy=tax, ecats=ecats)
+        tbl_obj.load_json(table, entity_label, section_label)
+        sink.add_table(tbl_obj, None)
+    sink.close()
 
 
 if __name__ == '__main__':
     arg = get_arguments()
+    du.set_lca_options(max_entities=arg.lca_max_entities, patience=arg.lca_patience)
+
+    if arg.prune:
+        tax, ecats = pruning.load_pruned_resources(arg.tables, arg.taxonomy, arg.entity_cat, start=arg.start_offset,
+                                                   limit=None if arg.random_sample else arg.data_limit, cache_dir=arg.prune_cache)
+        print('Loaded the pruned resources with {:d} categories and {:d} entities.'.format(len(tax), len(ecats)))
+    elif arg.shared_resources is not None:
+        # the shared resources come with the precomputed ancestor closure
+        tax, ecats, _ = du.load_shared_resources(arg.shared_resources)
+        print('Loaded the shared resources with {:d} categories and {:d} entities.'.format(len(tax), len(ecats)))
+    else:
+        # load the flat taxonomy
+        tax = du.load_flat_cat_tax(arg.taxonomy)
+        print('Loaded the taxonomy data with {:d} instances.'.format(len(tax)))
 
-    # load the flat taxonomy
-    tax = du.load_flat_cat_tax(arg.taxonomy)
-    print('Loaded the taxonomy data with {:d} instances.'.format(len(tax)))
+        # precompute the ancestor closure of the taxonomy used for the column typing
+        tax_index = du.get_tax_index(tax)
+        print('Computed the taxonomy ancestor closure with {:d} entries.'.format(len(tax_index.anc_values)))
 
-    # load the entity category associations
-    ecats = du.load_entity_cats(arg.entity_cat)
-    print('Loaded the entity category data with {:d} instances.'.format(len(ecats)))
+        # load the entity category associations
+        ecats = du.load_entity_cats(arg.entity_cat)
+        print('Loaded the entity category data with {:d} instances.'.format(len(ecats)))
 
     out_file = arg.out_dir + '/table_stats.tsv'
-    gather_table_stats(arg.tables, out_file, tax, ecats)
+    gather_table_stats(arg.tables, out_file, tax, ecats, start=arg.start_offset, limit=arg.data_limit, random_sample=arg.random_sample,
+                       stratify=arg.stratify, seed=arg.seed)
@@ -3,164 +3,286 @@
 '''
 
 import json
-import re
-from urllib.parse import quote_plus
+
+from metrics import metrics
+from nt_encoding import NTEncoder
+from nt_writer import NTriplesWriter
+from triple_store import DictTripleWriter
+
+'''
+    The predicates and constant objects of the triples. The predicates include the surrounding spaces and the constant
+    objects the closing ' .\n', such that a triple is simply the concatenation of its parts.
+'''
+
+TN_SCHEMA = 'https://www.tablenet.l3s.uni-hannover.de/TableNet#'
+TN_TABLE_PREFIX = '<http://www.tablenet.l3s.uni-hannover.de/TableNet#'
+TN_TABLE_JSON_PREFIX = '<http://www.tablenet.l3s.uni-hannover.de/TableNet/json/'
+
+RDF_TYPE = ' <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> '
+DCT_SOURCE = ' <http://purl.org/dc/terms/source> '
+DCT_SUBJECT = ' <http://purl.org/dc/terms/subject> '
+
+TYPE_TABLE = RDF_TYPE + '<' + TN_SCHEMA + 'Table> .\n'
+TYPE_COLUMN = RDF_TYPE + '<http://www.tablenet.l3s.uni-hannover.de/TableNet#Column> .\n'
+TYPE_ROW = RDF_TYPE + '<' + TN_SCHEMA + 'Row> .\n'
+TYPE_CELL = RDF_TYPE + '<' + TN_SCHEMA + 'Cell> .\n'
+
+HAS_TABLE_ID = ' <' + TN_SCHEMA + 'hasTableID> '
+NUMBER_OF_COLUMNS = ' <' + TN_SCHEMA + 'numberOfColumns> '
+NUMBER_OF_ROWS = ' <' + TN_SCHEMA + 'numberOfRows> '
+HAS_CAPTION = ' <' + TN_SCHEMA + 'hasCaption> "'
+DOCUMENT = ' <' + TN_SCHEMA + 'document> <http://en.wikipedia.org/wiki/'
+SOURCE = DCT_SOURCE + '<http://dbepdia.org/resource/'
+RESOURCE_URL = ' <' + TN_SCHEMA + 'resourceURL> '
+
+COLUMN_POSITION = ' <' + TN_SCHEMA + 'columnPosition> '
+HAS_LEVEL = ' <' + TN_SCHEMA + 'hasLevel> '
+COLUMN_NAME = ' <' + TN_SCHEMA + 'columnName> "'
+SUBJECT = DCT_SUBJECT + '"'
+SUBJECT_NA = DCT_SUBJECT + '"N/A" .\n'
+HAS_COLUMN = ' <' + TN_SCHEMA + 'hasColumn> '
+
+ROW_POSITION = ' <' + TN_SCHEMA + 'rowPosition> '
+HAS_ROW = ' <' + TN_SCHEMA + 'hasRow> '
+
+CELL_VALUE_IRI = ' <' + TN_SCHEMA + 'cellValue> <http://en.wikipedia.org/wiki/'
+REFERS_TO = ' <' + TN_SCHEMA + 'refersTo> <http://dbpedia.org/resource/'
+CELL_VALUE_LITERAL = ' <' + TN_SCHEMA + 'cellValue> "'
+CELL_TYPE = ' <' + TN_SCHEMA + 'cellType> "'
+PART_OF_COLUMN = ' <' + TN_SCHEMA + 'partOfColumn> '
+HAS_CELL = ' <' + TN_SCHEMA + 'hasCell> '
+
+IRI_END = '> .\n'
+LITERAL_END = '" .\n'
+TRIPLE_END = ' .\n'
 
 
 class Tbl2KgMapper:
-    def __init__(self, tables, out_dir, is_light=False, suffix='part_1'):
+    def __init__(self, tables, out_dir, is_light=False, suffix='part_1', compression='none', max_file_size=None, output_format='nt',
+                 checkpoint_interval=None, resume=False, sinks=None, encoder=None):
         self.tables = tables
         self.out_dir = out_dir
         self.is_light = is_light
         self.suffix = suffix
+        self.compression = compression
+        self.max_file_size = max_file_size
+        self.output_format = output_format
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+
+        # further consumers of the tables and their triples besides the KG writer (see sinks.py)
+        self.sinks = [] if sinks is None else sinks
+        # the memoized encoding of the IRIs and literals (see nt_encoding.py)
+        self.encoder = NTEncoder() if encoder is None else encoder
+
+    '''
+        The output is either written as N-Triples (nt) or as dictionary-encoded triples (dict, see triple_store). Only the
+        N-Triples output supports checkpoints.
+    '''
+
+    def get_writer(self):
+        if self.output_format == 'dict':
+            return DictTripleWriter(self.out_dir, self.suffix)
+        return NTriplesWriter(self.out_dir, self.suffix, compression=self.compression, max_file_size=self.max_file_size,
+                              checkpoint_interval=self.checkpoint_interval, resume=self.resume)
 
     def write_tables(self):
         # iterate over all tables and generate the content.
-        fout = open(self.out_dir + '/wikitbls_kg_' + self.suffix + '.nt', 'wt')
-        out = ''
+        writer = self.get_writer()
+
+        num_tables = 0
+        tables = self.__iter_tables()
+        while True:
+            # the processing time of a table includes its loading, in case the tables are produced by a generator
+            token = metrics.start_table()
+            table = next(tables, None)
+            if table is None:
+                metrics.end_table(token, None)
+                break
+
+            with metrics.stage('serialize'):
+                data = self.map_table_to_resource(table)
+            with metrics.stage('write'):
+                writer.write(data)
+            self.add_to_sinks(table, data)
+            self.count_table(table, data)
+            num_tables += 1
+            metrics.end_table(token, table.table_id)
+
+        with metrics.stage('write'):
+            writer.close()
+        self.finish()
+        metrics.count('bytes', writer.bytes_written)
+        print('Finished writing all the data into the knowledge graph ({:d} tables, {:d} bytes).'.format(num_tables, writer.bytes_written))
 
-        for table_id in self.tables:
-            table = self.tables[table_id]
-            out += self.map_table_to_resource(table)
-            if len(out) > 100000:
-                fout.write(out)
-                out = ''
+    '''
+        Count the written tables, rows, cells and triples in the metrics (also of the tables written by the pipeline).
+    '''
+
+    def count_table(self, table, data):
+        if metrics.enabled:
+            metrics.count('tables')
+            metrics.count('rows', len(table.table_rows))
+            metrics.count('cells', sum(len(row) - row.count(None) for row in table.table_rows))
+            metrics.count('triples', data.count('\n'))
 
-        fout.write(out)
-        fout.flush()
-        fout.close()
-        print('Finished writing all the data into the knowledge graph.')
+    def add_to_sinks(self, table, data):
+        if not self.sinks:
+            return
+        with metrics.stage('sinks'):
+            for sink in self.sinks:
+                sink.add_table(table, data)
+
+    '''
+        Close the sinks and report the hit rates of the encoder caches, once all the tables have been written.
+    '''
+
+    def finish(self):
+        with metrics.stage('sinks'):
+            for sink in self.sinks:
+                sink.close()
+        self.encoder.report()
+        print('IRI cache hit rate {:.1%}, cell value cache hit rate {:.1%}.'.format(self.encoder.get_hit_rate('iri'),
+                                                                                   self.encoder.get_hit_rate('value')))
+
+    '''
+        The tables can either be a dictionary of table ID -> table, or any iterable (e.g. a generator) of tables, in which
+        case the tables are mapped and written as they are produced, without keeping them in memory.
+    '''
+
+    def __iter_tables(self):
+        if isinstance(self.tables, dict):
+            return iter(self.tables.values())
+        return iter(self.tables)
 
     '''
         Map a table in JSON format to its RDF representation according to the WikiTablesKG schema.
     '''
 
     def map_table_to_resource(self, table):
-        tbl_uri = '<http://www.tablenet.l3s.uni-hannover.de/TableNet#{:d}>'.format(table.table_id)
-        tbl_uri_json_raw = '<http://www.tablenet.l3s.uni-hannover.de/TableNet/json/{:d}>'.format(table.table_id)
+        tbl_id = str(table.table_id)
+        tbl_uri = TN_TABLE_PREFIX + tbl_id + '>'
+        tbl_uri_json_raw = TN_TABLE_JSON_PREFIX + tbl_id + '>'
 
+        out = []
         # add table metadata
-        out_meta = self.__add_table_metadata(table=table, table_URI=tbl_uri, table_URI_json_raw=tbl_uri_json_raw)
+        self.__add_table_metadata(out, table=table, table_URI=tbl_uri, table_URI_json_raw=tbl_uri_json_raw)
 
         # add the column information.
-        out_col, columns = self.__add_table_columns(table=table, table_URI=tbl_uri)
+        columns = self.__add_table_columns(out, table=table, table_URI=tbl_uri)
 
         # add the row information.
-        out_row = ''
         if not self.is_light:
-            out_row = self.__add_row_data(table=table, table_URI=tbl_uri, columns=columns)
+            self.__add_row_data(out, table=table, table_URI=tbl_uri, columns=columns)
 
-        tbl_out = out_meta + out_col + out_row
-        return tbl_out
+        return ''.join(out)
 
     '''
         Add the metadata data about the table, which includes the number of rows, columns, access to the raw content etc.
     '''
 
-    def __add_table_metadata(self, table, table_URI, table_URI_json_raw):
-        out = '{} <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <https://www.tablenet.l3s.uni-hannover.de/TableNet#Table> .\n'.format(table_URI)
+    def __add_table_metadata(self, out, table, table_URI, table_URI_json_raw):
+        out.append(table_URI + TYPE_TABLE)
 
-        out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#hasTableID> {:d} .\n'.format(table_URI, table.table_id)
-        out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#numberOfColumns> {:d} .\n'.format(table_URI, table.num_cols)
-        out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#numberOfRows> {:d} .\n'.format(table_URI, len(table.table_rows))
+        out.append(table_URI + HAS_TABLE_ID + str(table.table_id) + TRIPLE_END)
+        out.append(table_URI + NUMBER_OF_COLUMNS + str(table.num_cols) + TRIPLE_END)
+        out.append(table_URI + NUMBER_OF_ROWS + str(len(table.table_rows)) + TRIPLE_END)
 
+        encode_document = self.encoder.encode_document
         if len(table.table_caption):
-            caption = table.table_caption
-            caption = caption.replace('"', '')
-
-            out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#hasCaption> "{}" .\n'.format(table_URI, caption)
+            out.append(table_URI + HAS_CAPTION + self.encoder.encode_literal(table.table_caption) + LITERAL_END)
 
         section = '' if table.section == 'MAIN_SECTION' else table.section
 
-        entity = re.sub(' ', '_', table.entity)
-        section = re.sub(' ', '_', section)
-
-        doc_source_section_URI = quote_plus('{}#{}'.format(entity, section))
-        doc_source_URI = quote_plus('{}'.format(entity))
+        # the encoded '#' separates the entity and the section
+        doc_source_URI = encode_document(table.entity)
+        doc_source_section_URI = doc_source_URI + '%23' + encode_document(section)
 
-        out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#document> <http://en.wikipedia.org/wiki/{}> .\n'.format(table_URI, doc_source_section_URI)
-        out += '{} <http://purl.org/dc/terms/source> <http://dbepdia.org/resource/{}> .\n'.format(table_URI, doc_source_URI)
-        out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#resourceURL> {} .\n'.format(table_URI, table_URI_json_raw)
+        out.append(table_URI + DOCUMENT + doc_source_section_URI + IRI_END)
+        out.append(table_URI + SOURCE + doc_source_URI + IRI_END)
+        out.append(table_URI + RESOURCE_URL + table_URI_json_raw + TRIPLE_END)
 
         # if not self.is_light:
         #     out += '{} {}:rawJSON "{}" .\n'.format(table_URI, self.schema_prefix, json.dumps(table.table_json))
 
-        return out
-
     '''
         Add the column information.
     '''
 
-    def __add_table_columns(self, table, table_URI):
-        out = ''
-        columns = {}
+    def __add_table_columns(self, out, table, table_URI):
+        columns = []
+        tbl_id = str(table.table_id)
+        last_level = len(table.columns) - 1
+        encode_iri = self.encoder.encode_iri
+        encode_literal = self.encoder.encode_literal
         for col_level in range(len(table.columns)):
             columns_ = table.columns[col_level]
+            col_uri_prefix = '<' + TN_SCHEMA + tbl_id + '_' + str(col_level) + '_'
+            col_level_triple = HAS_LEVEL + str(col_level) + TRIPLE_END
             for col_idx, column in enumerate(columns_):
-                column_ = column.replace('"', '\'\'')
-                col_uri_base = quote_plus(re.sub(' ', '_', column_))
-
-                col_URI = '<https://www.tablenet.l3s.uni-hannover.de/TableNet#{:d}_{:d}_{}>'.format(table.table_id, col_level, col_uri_base)
-                out += '{} <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://www.tablenet.l3s.uni-hannover.de/TableNet#Column> .\n'.format(col_URI)
-                out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#columnPosition> {:d} .\n'.format(col_URI, col_idx)
-                out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#hasLevel> {:d} .\n'.format(col_URI, col_level)
-                out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#columnName> "{}" .\n'.format(col_URI, column_)
+                col_URI = col_uri_prefix + encode_iri(column) + '>'
+                out.append(col_URI + TYPE_COLUMN)
+                out.append(col_URI + COLUMN_POSITION + str(col_idx) + TRIPLE_END)
+                out.append(col_URI + col_level_triple)
+                out.append(col_URI + COLUMN_NAME + encode_literal(column) + LITERAL_END)
 
                 # here we only assign types to columns that are of the lowest level, otherwise we mark it as NA
-                if col_level == len(table.columns) - 1:
-                    col_type = table.column_types[column].replace('"', '\'\'')
-                    col_type_quoted = quote_plus(re.sub(' ', '_', col_type))
-                    out += '{} <http://purl.org/dc/terms/subject> "{}" .\n'.format(col_URI, col_type_quoted)
+                if col_level == last_level:
+                    out.append(col_URI + SUBJECT + encode_iri(table.column_types[column]) + LITERAL_END)
                 else:
-                    out += '{} <http://purl.org/dc/terms/subject> "N/A" .\n'.format(col_URI)
+                    out.append(col_URI + SUBJECT_NA)
 
-                out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#hasColumn> {} .\n'.format(table_URI, col_URI)
+                out.append(table_URI + HAS_COLUMN + col_URI + TRIPLE_END)
 
-                # add the column data for later use, we store only the last layer
-                if col_level == len(table.columns) - 1:
-                    columns[column] = col_URI
-        return out, columns
+                # add the column data for later use, we store only the last layer (aligned with the row cells)
+                if col_level == last_level:
+                    columns.append(col_URI)
+        return columns
 
     '''
         Add the row data. We add the different rows, and for each row we add cell values which correspondingly have a column assigned to them.
     '''
 
-    def __add_row_data(self, table, table_URI, columns):
-        out = ''
+    def __add_row_data(self, out, table, table_URI, columns):
         # print (columns)
+        tbl_id = str(table.table_id)
+        row_prefix = '_:r' + tbl_id + '_'
+        cell_prefix = '_:c' + tbl_id + '_'
+        has_row = table_URI + HAS_ROW
+        encode_iri = self.encoder.encode_iri
+        encode_value = self.encoder.encode_value
+
         cell_counter = 0
         for row_idx, row in enumerate(table.table_rows):
-            row_URI = '_:r{:d}_{:d}'.format(table.table_id, row_idx)
+            row_URI = row_prefix + str(row_idx)
+            has_cell = row_URI + HAS_CELL
 
-            out += '{} <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <https://www.tablenet.l3s.uni-hannover.de/TableNet#Row> .\n'.format(row_URI)
-            out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#rowPosition> {:d} .\n'.format(row_URI, row_idx)
-            out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#hasRow> {} .\n'.format(table_URI, row_URI)
+            out.append(row_URI + TYPE_ROW)
+            out.append(row_URI + ROW_POSITION + str(row_idx) + TRIPLE_END)
+            out.append(has_row + row_URI + TRIPLE_END)
 
-            # add the cell values to the row
-            for column in row.keys():
-                cell_type, cell_extracted_val, cell_val = row[column]
+            # add the cell values to the row, the rows are aligned with the columns and None for columns without a cell
+            for col_idx, cell in enumerate(row):
+                if cell is None:
+                    continue
+                cell_type, cell_extracted_val, cell_val = cell
 
-                col_URI = columns[column]
-                cell_URI = '_:c{:d}_{:d}'.format(table.table_id, cell_counter)
-                out += '{} <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <https://www.tablenet.l3s.uni-hannover.de/TableNet#Cell> .\n'.format(cell_URI)
+                col_URI = columns[col_idx]
+                cell_URI = cell_prefix + str(cell_counter)
+                out.append(cell_URI + TYPE_CELL)
 
                 if cell_type == 'STRUCT':
                     for val_ in cell_extracted_val:
                         if len(val_):
-                            val_tmp = val_.replace('"', '\'\'')
-                            cell_struct_URI = quote_plus('{}'.format(re.sub(' ', '_', val_tmp)))
+                            cell_struct_URI = encode_iri(val_)
 
-                            out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#cellValue> <http://en.wikipedia.org/wiki/{}> .\n'.format(cell_URI, cell_struct_URI)
-                            out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#refersTo> <http://dbpedia.org/resource/{}> .\n'.format(cell_URI, cell_struct_URI)
+                            out.append(cell_URI + CELL_VALUE_IRI + cell_struct_URI + IRI_END)
+                            out.append(cell_URI + REFERS_TO + cell_struct_URI + IRI_END)
                 else:
-                    cell_val_ = cell_val.replace('"', '\'\'')
-                    cell_val_escaped = quote_plus('{}'.format(re.sub(' ', '_', cell_val_)))
-                    out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#cellValue> "{}" .\n'.format(cell_URI, cell_val_escaped)
+                    out.append(cell_URI + CELL_VALUE_LITERAL + encode_value(cell_val) + LITERAL_END)
 
-                out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#cellType> "{}" .\n'.format(cell_URI, cell_type)
+                out.append(cell_URI + CELL_TYPE + cell_type + LITERAL_END)
 
-                out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#partOfColumn> {} .\n'.format(cell_URI, col_URI)
-                out += '{} <https://www.tablenet.l3s.uni-hannover.de/TableNet#hasCell> {} .\n'.format(row_URI, cell_URI)
+                out.append(cell_URI + PART_OF_COLUMN + col_URI + TRIPLE_END)
+                out.append(has_cell + cell_URI + TRIPLE_END)
                 cell_counter += 1
-
-        return out
@@ -0,0 +1,264 @@
+'''
+    Dictionary-encoded binary output of the knowledge graph, as an alternative to the N-Triples text. For the output
+    wikitbls_kg_<suffix> we write the following files:
+        .terms          the UTF-8 encoded terms (IRIs, blank nodes and literals in their N-Triples form), concatenated
+        .terms.offsets  int64 offsets into .terms, the term with ID i is terms[offsets[i]:offsets[i + 1]]
+        .triples        int64 (subject, predicate, object) term IDs, i.e. a (num_triples, 3) array
+        .meta.json      the number of terms and triples
+
+    All arrays are little-endian int64, such that they can be memory-mapped with NumPy, e.g.
+    numpy.memmap(path + '.triples', dtype='<i8', mode='r').reshape(-1, 3)
+'''
+
+import argparse
+import json
+import mmap
+import os
+import sqlite3
+from array import array
+from collections import Counter
+
+TERM_FILES = ['.terms', '.terms.offsets', '.triples', '.meta.json']
+
+
+'''
+    Terms that belong to a single table, i.e. the row/cell blank nodes and the IRIs of the table and its columns, which
+    contain the table ID. These are only kept in the term dictionary while the table is being written.
+'''
+
+
+def is_table_term(term):
+    if term.startswith('_:'):
+        return True
+    if 'tablenet.l3s.uni-hannover.de/TableNet' not in term:
+        return False
+    return term[max(term.rfind('#'), term.rfind('/')) + 1].isdigit()
+
+
+class DictTripleWriter:
+    def __init__(self, out_dir, suffix, max_cached_terms=20000000, buffer_size=1 << 18):
+        self.base_path = out_dir + '/wikitbls_kg_' + suffix
+        self.paths = [self.base_path + ext for ext in TERM_FILES]
+        self.max_cached_terms = max_cached_terms
+        self.buffer_size = buffer_size
+
+        self.terms_out = open(self.base_path + '.terms', 'wb')
+        self.offsets_out = open(self.base_path + '.terms.offsets', 'wb')
+        self.triples_out = open(self.base_path + '.triples', 'wb')
+        array('q', [0]).tofile(self.offsets_out)
+
+        # the IDs of the terms that are shared across tables. If the dictionary grows beyond max_cached_terms, it is
+        # spilled into a temporary SQLite database, where the terms that are not cached are looked up, such that every
+        # term has a single ID. The predicates are pinned in memory.
+        self.term_ids = {}
+        self.predicate_ids = {}
+        self.spill_path = self.base_path + '.terms.spill'
+        self.spill_conn = None
+        self.num_terms = 0
+        self.terms_end = 0
+        self.num_triples = 0
+        self.bytes_written = 0
+
+        self.new_terms = []
+        self.new_offsets = array('q')
+        self.triples = array('q')
+
+    def __get_id(self, term, table_term_ids):
+        if is_table_term(term):
+            term_id = table_term_ids.get(term)
+            if term_id is None:
+                term_id = table_term_ids[term] = self.__add_term(term)
+            return term_id
+
+        term_id = self.predicate_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.__find_spilled_term(term)
+            if term_id is None:
+                term_id = self.__add_term(term)
+            self.__cache_term(term, term_id)
+        return term_id
+
+    def __get_predicate_id(self, term, table_term_ids):
+        term_id = self.predicate_ids.get(term)
+        if term_id is None:
+            term_id = self.predicate_ids[term] = self.__get_id(term, table_term_ids)
+        return term_id
+
+    def __add_term(self, term):
+        term_id = self.num_terms
+        self.num_terms += 1
+
+        term_bytes = term.encode('utf-8')
+        self.new_terms.append(term_bytes)
+        self.terms_end += len(term_bytes)
+        self.new_offsets.append(self.terms_end)
+        return term_id
+
+    def __cache_term(self, term, term_id):
+        if len(self.term_ids) >= self.max_cached_terms:
+            self.__spill_terms()
+        self.term_ids[term] = term_id
+
+    def __spill_terms(self):
+        if self.spill_conn is None:
+            if os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+            self.spill_conn = sqlite3.connect(self.spill_path)
+            self.spill_conn.execute('PRAGMA journal_mode = OFF')
+            self.spill_conn.execute('PRAGMA synchronous = OFF')
+            self.spill_conn.execute('CREATE TABLE terms (term TEXT PRIMARY KEY, term_id INTEGER) WITHOUT ROWID')
+        # the terms that have been looked up in the spilled terms are already there
+        self.spill_conn.executemany('INSERT OR IGNORE INTO terms VALUES (?, ?)', self.term_ids.items())
+        self.spill_conn.commit()
+        self.term_ids.clear()
+
+    def __find_spilled_term(self, term):
+        if self.spill_conn is None:
+            return None
+        row = self.spill_conn.execute('SELECT term_id FROM terms WHERE term = ?', (term,)).fetchone()
+        return None if row is None else row[0]
+
+    '''
+        Add the N-Triples of one or more tables. The subject and predicate never contain spaces, while the object is
+        everything up to the closing ' .'.
+    '''
+
+    def write(self, data):
+        table_term_ids = {}
+        for line in data.split('\n'):
+            if not line:
+                continue
+            s, p, o = line.split(' ', 2)
+            self.triples.append(self.__get_id(s, table_term_ids))
+            self.triples.append(self.__get_predicate_id(p, table_term_ids))
+            self.triples.append(self.__get_id(o[:-2], table_term_ids))
+
+        if len(self.triples) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        terms = b''.join(self.new_terms)
+        self.terms_out.write(terms)
+        self.new_offsets.tofile(self.offsets_out)
+        self.triples.tofile(self.triples_out)
+
+        self.num_triples += len(self.triples) // 3
+        self.bytes_written += len(terms) + len(self.new_offsets) * 8 + len(self.triples) * 8
+        self.new_terms.clear()
+        self.new_offsets = array('q')
+        self.triples = array('q')
+
+    def close(self):
+        self.flush()
+        self.terms_out.close()
+        self.offsets_out.close()
+        self.triples_out.close()
+        if self.spill_conn is not None:
+            self.spill_conn.close()
+            os.remove(self.spill_path)
+
+        with open(self.base_path + '.meta.json', 'wt') as fout:
+            json.dump({'num_terms': self.num_terms, 'num_triples': self.num_triples, 'dtype': '<i8'}, fout)
+
+
+'''
+    Reader for the dictionary-encoded triples, all files are memory-mapped.
+'''
+
+
+class DictTripleReader:
+    def __init__(self, base_path):
+        self.base_path = base_path
+        with open(base_path + '.meta.json', 'rt') as fin:
+            self.meta = json.load(fin)
+        self.num_terms = self.meta['num_terms']
+        self.num_triples = self.meta['num_triples']
+
+        self.terms = self.__map(base_path + '.terms')
+        self.offsets = self.__map(base_path + '.terms.offsets').cast('q')
+        self.triples = self.__map(base_path + '.triples').cast('q')
+
+    @staticmethod
+    def __map(path):
+        with open(path, 'rb') as fin:
+            # empty files cannot be memory-mapped
+            if fin.seek(0, 2) == 0:
+                return memoryview(b'')
+            return memoryview(mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self.num_triples
+
+    def get_term(self, term_id):
+        return str(self.terms[self.offsets[term_id]:self.offsets[term_id + 1]], 'utf-8')
+
+    '''
+        Iterate over the (subject, predicate, object) term IDs.
+    '''
+
+    def __iter__(self):
+        triples = self.triples
+        for pos in range(0, self.num_triples * 3, 3):
+            yield triples[pos], triples[pos + 1], triples[pos + 2]
+
+    def iter_terms(self):
+        for s, p, o in self:
+            yield self.get_term(s), self.get_term(p), self.get_term(o)
+
+    def to_ntriples(self, out_file, buffer_size=100000):
+        with open(out_file, 'wt', encoding='utf-8') as fout:
+            out = []
+            for s, p, o in self.iter_terms():
+                out.append(s + ' ' + p + ' ' + o + ' .\n')
+                if len(out) >= buffer_size:
+                    fout.write(''.join(out))
+                    out.clear()
+            fout.write(''.join(out))
+
+    '''
+        The triples as a (num_triples, 3) NumPy array, which requires NumPy to be installed.
+    '''
+
+    def as_numpy(self):
+        import numpy as np
+        return np.frombuffer(self.triples, dtype=self.meta['dtype']).reshape(-1, 3)
+
+    '''
+        Count the triples per predicate, vectorized if NumPy is available.
+    '''
+
+    def count_predicates(self):
+        try:
+            import numpy as np
+        except ImportError:
+            counts = Counter(self.triples[1::3])
+        else:
+            ids, id_counts = np.unique(self.as_numpy()[:, 1], return_counts=True)
+            counts = dict(zip(ids.tolist(), id_counts.tolist()))
+
+        # the counts are summed up per term, in case a term has several IDs (e.g. written by an older version)
+        term_counts = Counter()
+        for term_id, count in counts.items():
+            term_counts[self.get_term(term_id)] += count
+        return dict(term_counts)
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Use this script to read the dictionary-encoded WikiTablesKG triples.')
+    parser.add_argument('-i', '--input', help='The base path of the dictionary-encoded triples, i.e. without the file extensions.', required=True)
+    parser.add_argument('-o', '--out_file', help='Convert the triples back into the N-Triples file.', required=False)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arg = get_arguments()
+
+    reader = DictTripleReader(arg.input)
+    print('Loaded {:d} triples with {:d} terms.'.format(reader.num_triples, reader.num_terms))
+    if arg.out_file is not None:
+        reader.to_ntriples(arg.out_file)
+    else:
+        for predicate, count in sorted(reader.count_predicates().items()):
+            print('{}\t{:d}'.format(predicate, count))